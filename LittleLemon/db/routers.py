@@ -0,0 +1,148 @@
+"""
+Read/write splitting for the catalog and order history.
+
+Reads of the replicated models go to a replica listed in
+``DATABASE_REPLICAS`` whose lag is within ``REPLICA_MAX_LAG`` seconds;
+everything else, and every read once the request has written or while an
+``atomic()`` block is open on the primary, stays on ``default``.
+
+Within a request only views that set ``replica_reads = True`` read from a
+replica. Those are listings and exports, which may trail a write by up to
+the lag; a single resource fetched right after it was created must not 404.
+"""
+import os
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICATED_MODELS = {
+    'LittleLemonAPI.menuitem',
+    'LittleLemonAPI.category',
+    'LittleLemonAPI.order',
+    'LittleLemonAPI.orderitem',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_pinned = ContextVar('pinned_to_primary', default=False)
+_request = ContextVar('routed_request', default=None)
+_lag_cache = {}
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def replica_allowed():
+    if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return False
+    request = _request.get()
+    if request is None:
+        # Management commands and scripts outside a request.
+        return True
+    # Resolved by the time the view runs, which is when it reads.
+    match = getattr(request, 'resolver_match', None)
+    view_class = getattr(match.func, 'view_class', None) if match is not None else None
+    return getattr(view_class, 'replica_reads', False)
+
+
+def sync_stamp_path(alias):
+    return f"{connections.settings[alias]['NAME']}.synced"
+
+
+def replica_lag(alias):
+    """
+    Seconds since the replica's last successful sync, or None when it has
+    never been synced. Local SQLite replicas are stamped by
+    ``manage.py sync_replica``; other engines are assumed to be current.
+    """
+    now = time.monotonic()
+    cached = _lag_cache.get(alias)
+    if cached is not None and now - cached[0] < 1:
+        return cached[1]
+
+    if 'sqlite3' not in connections.settings[alias]['ENGINE']:
+        lag = 0.0
+    else:
+        try:
+            lag = max(0.0, time.time() - os.stat(sync_stamp_path(alias)).st_mtime)
+        except OSError:
+            lag = None
+
+    _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def fresh_replicas():
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG', 5)
+    replicas = []
+    for alias in getattr(settings, 'DATABASE_REPLICAS', []):
+        lag = replica_lag(alias)
+        if lag is not None and lag <= max_lag:
+            replicas.append(alias)
+    return replicas
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICATED_MODELS:
+            return None
+        if not replica_allowed():
+            return DEFAULT_DB_ALIAS
+        replicas = fresh_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Reads that follow a write in the same request must see it.
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are byte copies of the primary and are never migrated.
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Starts every request unpinned, except unsafe methods, which read from
+    the primary throughout so read-modify-write handlers never save a
+    stale replica row. Safe requests still read from the primary unless
+    their view sets ``replica_reads``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pinned, current = _pinned.set(request.method not in SAFE_METHODS), _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(current)
+            _pinned.reset(pinned)
+
+    async def __acall__(self, request):
+        pinned, current = _pinned.set(request.method not in SAFE_METHODS), _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(current)
+            _pinned.reset(pinned)
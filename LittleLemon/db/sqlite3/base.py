@@ -0,0 +1,37 @@
+"""
+SQLite backend tuned for serving the API from a single database file.
+
+Configured through ``DATABASES[...]['OPTIONS']``:
+
+* ``pragmas``: PRAGMA name -> value, applied to every new connection
+  (e.g. WAL journaling so cart writes no longer block menu readers).
+* ``transaction_mode``: ``"IMMEDIATE"`` takes the write lock when an
+  ``atomic()`` block starts instead of failing with "database is locked"
+  when a reader later tries to upgrade.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    transaction_mode = None
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        # Django < 5.1 leaves transaction_mode in the connect() kwargs.
+        transaction_mode = kwargs.pop('transaction_mode', None)
+        if transaction_mode:
+            self.transaction_mode = transaction_mode.upper()
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            self.cursor().execute('BEGIN')
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
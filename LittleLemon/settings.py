@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,21 +41,28 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'LittleLemonAPI',
-    'debug_toolbar',
     'djoser',
 ]
 
 MIDDLEWARE = [
+    'LittleLemonAPI.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'LittleLemon.db.routers.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'LittleLemonAPI.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+# The toolbar is a development aid only; production relies on the metrics
+# endpoint instead.
+if DEBUG:
+    INSTALLED_APPS += ['debug_toolbar']
+    MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
+
 ROOT_URLCONF = 'LittleLemon.urls'
 
 TEMPLATES = [
@@ -81,11 +89,50 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'LittleLemon.db.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 268435456,
+                'cache_size': -65536,
+                'busy_timeout': 5000,
+                'temp_store': 'MEMORY',
+            },
+        },
+    },
+    # Local stand-in replica, refreshed by `manage.py sync_replica`. It is
+    # skipped until the first sync and whenever it lags REPLICA_MAX_LAG.
+    'replica': {
+        'ENGINE': 'LittleLemon.db.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pragmas': {
+                'query_only': 1,
+                'mmap_size': 268435456,
+                'cache_size': -65536,
+                'busy_timeout': 5000,
+            },
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['LittleLemon.db.routers.ReplicaRouter']
+
+DATABASE_REPLICAS = ['replica']
+
+# Seconds a replica may trail the primary before reads skip it.
+REPLICA_MAX_LAG = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -135,14 +182,74 @@ REST_FRAMEWORK = {
         # 'rest_framework_xml.renderers.XMLRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_THROTTLE_RATES': {
-        'user': '5/minute'
+        'user': '5/minute',
+        'categories': '5/minute',
+        'menu-items': '5/minute',
+        'menu-item': '5/minute',
+        'cart': '5/minute',
+        'managers': '5/minute',
+        'delivery-crew': '5/minute',
+        'orders': '5/minute',
+        'orders-export': '5/minute',
+        'orders-dispatch': '5/minute',
+        'orders-status': '5/minute',
+        'order': '5/minute',
+        'order-item': '5/minute',
+        'order-events': '5/minute',
     }
 }
 
+# Token buckets shared by every worker process on the host.
+THROTTLE_DB = BASE_DIR / 'throttle.sqlite3'
+
+# Counters shared by every worker process on the host
+# (LittleLemonAPI/shared.py), such as the catalog cache version.
+SHARED_STATE_DB = BASE_DIR / 'shared.sqlite3'
+
+# Per-process snapshots summed by the /api/metrics endpoint.
+METRICS_DIR = BASE_DIR / 'metrics'
+METRICS_FLUSH_INTERVAL = 5
+# Besides admins, /api/metrics answers a scraper sending
+# "Authorization: Bearer <METRICS_SCRAPE_TOKEN>" or connecting from one of
+# METRICS_ALLOWED_IPS.
+METRICS_SCRAPE_TOKEN = os.environ.get('METRICS_SCRAPE_TOKEN')
+METRICS_ALLOWED_IPS = []
+
+# Request profiles captured on the X-Profile header (staff only) or for
+# 1 in PROFILE_SAMPLE_RATE requests (0 disables sampling).
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_SAMPLE_RATE = 0
+PROFILE_STACK_INTERVAL = 0.001
+PROFILE_MAX_CAPTURES = 200
+
+# Views with a row_serializer build list responses from values() rows
+# instead of DRF serializers (LittleLemonAPI/rows.py).
+FAST_SERIALIZERS = True
+
+# Serve the catalog and order reads from the async views in
+# LittleLemonAPI/asyncviews.py. Only worth it under ASGI.
+ASYNC_READ_VIEWS = False
+
+# GET /api/orders/events (LittleLemonAPI/events.py). LocalBackend only
+# reaches clients of the process that made the change; SQLiteEventBackend
+# shares events between the worker processes on one host through PATH.
+ORDER_EVENTS = {
+    'BACKEND': 'LittleLemonAPI.events.LocalBackend',
+    'HISTORY': 1000,
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+}
+
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'CHECK_INTERVAL': 1,
+}
+
 DJOSER = {
     "USER_ID_FIELD": "username"
     # "LOGIN_FIELD": "username"
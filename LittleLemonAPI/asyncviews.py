@@ -0,0 +1,237 @@
+"""
+Async variants of the read endpoints, routed instead of the views in
+``views.py`` when ``ASYNC_READ_VIEWS`` is on (for ASGI deployments).
+
+Each view subclasses its synchronous counterpart, so URLs, throttle
+scopes and metrics labels are unchanged and the write handlers run as
+before in a worker thread. GET requests authenticate, check permissions
+and render on the event loop and read with the async ORM, so a slow client
+or a slow query no longer holds a worker thread for the whole request.
+Django still executes each ORM query in its sync thread.
+
+The parameter handling, cache lookups and response building are the sync
+views' own; only the fetch differs. Anything that reads or writes the
+shared SQLite files (throttle buckets, the token revocation and catalog
+version counters) goes through ``shared.offload``.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from rest_framework import exceptions, generics, status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from . import events, rows, views
+from .cache import catalog_validators
+from .conditional import not_modified, with_validators, order_validators
+from .metrics import add_time
+from .models import items_prefetch
+from .roles import aroles
+from .serializers import OrdersSerializer
+from .shared import offload
+from .throttling import TokenBucketThrottle
+
+
+# Permissions whose checks only look at request.user.
+PLAIN_PERMISSIONS = (AllowAny, IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly)
+
+
+def in_thread(handler):
+    async def handle(self, request, *args, **kwargs):
+        return await sync_to_async(handler)(self, request, *args, **kwargs)
+    return handle
+
+
+class AsyncAPIView:
+    """
+    Mixin giving a DRF view an async ``dispatch``. Handlers the subclass
+    leaves synchronous (writes, OPTIONS) are run in a thread.
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for method in cls.http_method_names:
+            handler = getattr(cls, method, None)
+            if handler is not None and not iscoroutinefunction(handler):
+                setattr(cls, method, in_thread(handler))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            handler = None
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                self.http_method_not_allowed(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return await self.arender(self.response)
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+        request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+        await self.aperform_authentication(request)
+        await self.acheck_permissions(request)
+        await offload(self.check_throttles)(request)
+
+    async def aperform_authentication(self, request):
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                elif isinstance(authenticator, SessionAuthentication):
+                    user = await request._request.auser()
+                    user_auth_tuple = None
+                    if user and user.is_active:
+                        authenticator.enforce_csrf(request)
+                        user_auth_tuple = user, None
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    async def acheck_permissions(self, request):
+        for permission in self.get_permissions():
+            if hasattr(permission, 'ahas_permission'):
+                allowed = await permission.ahas_permission(request, self)
+            elif type(permission) in PLAIN_PERMISSIONS:
+                allowed = permission.has_permission(request, self)
+            else:
+                allowed = await sync_to_async(permission.has_permission)(request, self)
+            if not allowed:
+                self.permission_denied(
+                    request, message=getattr(permission, 'message', None), code=getattr(permission, 'code', None),
+                )
+
+    async def arender(self, response):
+        # Handed back rendered, as a plain HttpResponse: Django would
+        # otherwise render a TemplateResponse in a thread.
+        if not isinstance(response, Response):
+            return response
+        started = time.perf_counter()
+        if isinstance(response.accepted_renderer, JSONRenderer):
+            response.render()
+        else:
+            # The browsable API can query the database while it renders.
+            await sync_to_async(response.render)()
+        add_time('render_seconds', time.perf_counter() - started)
+        rendered = HttpResponse(response.content, status=response.status_code)
+        for header, value in response.items():
+            rendered[header] = value
+        return rendered
+
+
+class CategoriesView(AsyncAPIView, views.CategoriesView):
+
+    async def get(self, request, *args, **kwargs):
+        etag = await offload(catalog_validators)('categories', ())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        categories = [category async for category in self.filter_queryset(self.get_queryset())]
+        serializer = self.get_serializer(categories, many=True)
+        return with_validators(request, Response(serializer.data), etag)
+
+
+class MenuItemsView(AsyncAPIView, views.MenuItemsView):
+
+    async def get(self, request):
+        listing = await offload(self.start_list)(request)
+        if not isinstance(listing, views.Listing):
+            return listing
+        return self.finish_list(request, listing, await listing.afetch())
+
+
+class SingleMenuItemView(AsyncAPIView, views.SingleMenuItemView):
+
+    async def get(self, request, *args, **kwargs):
+        etag = await offload(catalog_validators)('menu-item', (kwargs['pk'],))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        instance = await aget_object_or_404(self.filter_queryset(self.get_queryset()), pk=kwargs['pk'])
+        self.check_object_permissions(request, instance)
+        serializer = self.get_serializer(instance)
+        return with_validators(request, Response(serializer.data), etag)
+
+
+class OrderItemsView(AsyncAPIView, views.OrderItemsView):
+
+    async def get(self, request):
+        # start_list() picks the orders by role; load the roles first so it
+        # finds them memoized.
+        await aroles(request)
+        listing = self.start_list(request)
+        if not isinstance(listing, views.Listing):
+            return listing
+        return Response(listing.data(request, await listing.afetch()), status=status.HTTP_200_OK)
+
+
+class SingleOrderView(AsyncAPIView, views.SingleOrderView):
+    row_serializer = rows.RowSerializer(OrdersSerializer)
+
+    async def get(self, request, orderId):
+        order = await aget_object_or_404(self.owned(request, orderId))
+
+        etag = order_validators(order)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        if rows.enabled(self):
+            [data] = await self.row_serializer.aserialize([self.row_serializer.instance_row(order)])
+        else:
+            await sync_to_async(prefetch_related_objects)([order], items_prefetch())
+            data = OrdersSerializer(order).data
+
+        return with_validators(request, Response(data, status=status.HTTP_200_OK), etag)
+
+
+class OrderEventsView(AsyncAPIView, generics.GenericAPIView):
+    """
+    Server-Sent Events: an ``order`` event whenever the status or delivery
+    crew of one of the caller's orders (as customer or crew) changes.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'order-events'
+
+    async def get(self, request):
+        # Under WSGI the stream would hold a worker thread for as long as
+        # the client stays connected.
+        if not isinstance(request._request, ASGIRequest):
+            return Response({"message": "Order events are only served over ASGI"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        heartbeat = getattr(settings, 'ORDER_EVENTS', {}).get('HEARTBEAT', 15)
+        response = StreamingHttpResponse(
+            events.stream(request.user.pk, events.last_event_id(request), heartbeat),
+            content_type='text/event-stream',
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -0,0 +1,202 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .shared import counters, offload
+
+
+def revocations_key(user_id):
+    return f'auth:revocations:{user_id}'
+
+
+class _Entry:
+    __slots__ = ('user', 'token', 'expires', 'generation', 'checked')
+
+    def __init__(self, user, token, expires, generation, checked):
+        self.user = user
+        self.token = token
+        self.expires = expires
+        self.generation = generation
+        self.checked = checked
+
+
+class TokenCache:
+    """
+    Bounded LRU of token key -> (user, token) with a TTL per entry.
+
+    Entries are local to the process. Revoking a user's tokens (``revoked``)
+    bumps a counter for that user shared by all workers. A worker compares
+    an entry's counter with the one it cached at most every
+    ``check_interval`` seconds and drops the user's entries if it moved.
+    """
+
+    def __init__(self, max_size=10000, ttl=300, check_interval=1, counters=counters):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.counters = counters
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.auth_count = 0
+        self.auth_seconds = 0.0
+
+    def checked(self, key):
+        """Whether get(``key``) can answer without reading the shared counters."""
+        entry = self._entries.get(key)
+        return entry is not None and entry.checked + self.check_interval > time.monotonic()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+
+        if entry.checked + self.check_interval <= now:
+            generation = self.counters.get(revocations_key(entry.user.pk), 0)
+            with self._lock:
+                if generation != entry.generation:
+                    self._evict_user(entry.user.pk)
+                    self.misses += 1
+                    return None
+                entry.checked = now
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return entry.user, entry.token
+
+    def set(self, key, user, token):
+        generation = self.counters.get(revocations_key(user.pk), 0)
+        now = time.monotonic()
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = _Entry(user, token, now + self.ttl, generation, now)
+            self._keys_by_user.setdefault(user.pk, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def evict_key(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            self._evict_user(user_id)
+
+    def revoked(self, user_id):
+        """Tell every worker that the tokens of ``user_id`` it may hold have changed."""
+        self.counters.incr(revocations_key(user_id), 1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _evict_user(self, user_id):
+        for key in list(self._keys_by_user.get(user_id, ())):
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.evictions += 1
+        keys = self._keys_by_user.get(entry.user.pk)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry.user.pk]
+
+    def observe(self, seconds):
+        with self._lock:
+            self.auth_count += 1
+            self.auth_seconds += seconds
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'auth_count': self.auth_count,
+            'auth_seconds': self.auth_seconds,
+            'avg_auth_ms': self.auth_seconds * 1000 / self.auth_count if self.auth_count else None,
+        }
+
+
+_options = getattr(settings, 'TOKEN_AUTH_CACHE', {})
+token_cache = TokenCache(
+    max_size=_options.get('MAX_SIZE', 10000),
+    ttl=_options.get('TTL', 300),
+    check_interval=_options.get('CHECK_INTERVAL', 1),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        started = time.perf_counter()
+        try:
+            entry = token_cache.get(key)
+            if entry is None:
+                user, token = super().authenticate_credentials(key)
+                token_cache.set(key, user, token)
+                entry = user, token
+            # Each request gets its own copy so per-request state set on the
+            # user never leaks into the shared entry.
+            return copy.copy(entry[0]), entry[1]
+        finally:
+            token_cache.observe(time.perf_counter() - started)
+
+    async def aauthenticate(self, request):
+        """``authenticate`` for async views: only a cache miss awaits the database."""
+        key = _TokenKey().authenticate(request)
+        if key is None:
+            return None
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        started = time.perf_counter()
+        try:
+            # Off the event loop only when the shared counters will be read.
+            if token_cache.checked(key):
+                entry = token_cache.get(key)
+            else:
+                entry = await offload(token_cache.get)(key)
+            if entry is None:
+                try:
+                    token = await self.get_model().objects.select_related('user').aget(key=key)
+                except self.get_model().DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                if not token.user.is_active:
+                    raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+                await offload(token_cache.set)(key, token.user, token)
+                entry = token.user, token
+            return copy.copy(entry[0]), entry[1]
+        finally:
+            token_cache.observe(time.perf_counter() - started)
+
+
+class _TokenKey(TokenAuthentication):
+    # DRF's header parsing and errors, stopping short of the lookup.
+
+    def authenticate_credentials(self, key):
+        return key
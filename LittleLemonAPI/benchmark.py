@@ -0,0 +1,424 @@
+"""
+Endpoint benchmark suite driven through the Django test client.
+
+Every route in ``LittleLemonAPI/urls.py`` but the order event stream has
+at least one scenario. A scenario names the caller's role, the request to
+send and, for destructive requests, an untimed ``setup`` that creates the
+row the request consumes. Run it with ``manage.py bench``.
+"""
+import gc
+import importlib
+import json
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import clear_url_caches
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .roles import MANAGER, DELIVERY_CREW
+from .throttling import SQLiteBucketStore, TokenBucketThrottle
+
+
+class Scenario:
+
+    def __init__(self, name, method, path, role, data=None, setup=None, expect=200):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.role = role
+        self.data = data
+        self.setup = setup
+        self.expect = expect
+
+    def request(self, context):
+        state = self.setup(context) if self.setup else {}
+        path = self.path(context, state) if callable(self.path) else self.path
+        data = self.data(context, state) if callable(self.data) else self.data
+        return path, data
+
+
+@contextmanager
+def environment():
+    """
+    Run the body against throwaway test databases, with throttling pointed
+    at a private store whose limits never trip, replicas disabled, and
+    metrics snapshots and profiles kept in a scratch directory.
+    """
+    setup_test_environment(debug=False)
+    old_config = setup_databases(verbosity=0, interactive=False)
+    throttle_rates, throttle_store = TokenBucketThrottle.THROTTLE_RATES, TokenBucketThrottle.store
+    scratch = tempfile.TemporaryDirectory()
+    try:
+        TokenBucketThrottle.THROTTLE_RATES = {scope: '1000000/s' for scope in throttle_rates}
+        TokenBucketThrottle.store = SQLiteBucketStore(Path(scratch.name) / 'throttle.sqlite3')
+        with override_settings(
+            DATABASE_REPLICAS=[], METRICS_DIR=Path(scratch.name) / 'metrics', PROFILE_DIR=Path(scratch.name) / 'profiles',
+        ):
+            yield
+    finally:
+        TokenBucketThrottle.THROTTLE_RATES, TokenBucketThrottle.store = throttle_rates, throttle_store
+        scratch.cleanup()
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def seed(volumes, seed=0):
+    """
+    Populate the current database and return the ids the scenarios need.
+    ``volumes`` maps categories, menu_items, users, carts, orders and
+    items_per_order to row counts.
+    """
+    rng = random.Random(seed)
+    managers = Group.objects.create(name=MANAGER)
+    crew_group = Group.objects.create(name=DELIVERY_CREW)
+
+    admin = User.objects.create_user('bench-admin', is_staff=True)
+    manager = User.objects.create_user('bench-manager')
+    manager.groups.add(managers)
+    crew = User.objects.create_user('bench-crew')
+    crew.groups.add(crew_group)
+    customer = User.objects.create_user('bench-customer')
+
+    categories = Category.objects.bulk_create(
+        Category(slug=f'category-{n}', title=f'Category {n}') for n in range(volumes['categories'])
+    )
+    menu_items = MenuItem.objects.bulk_create(
+        MenuItem(
+            title=f'Menu item {n}',
+            price=Decimal(rng.randint(100, 5000)) / 100,
+            featured=rng.random() < 0.1,
+            category=rng.choice(categories),
+        )
+        for n in range(volumes['menu_items'])
+    )
+    users = User.objects.bulk_create(User(username=f'bench-user-{n}') for n in range(volumes['users']))
+    users += [customer]
+
+    Cart.objects.bulk_create(
+        Cart(user=user, menuitem=item, quantity=2, unit_price=item.price, price=item.price * 2)
+        for user in users[:volumes['carts']] if user != customer
+        for item in rng.sample(menu_items, min(3, len(menu_items)))
+    )
+
+    orders = Order.objects.bulk_create(
+        Order(
+            user=customer if n % 10 == 0 else rng.choice(users),
+            delivery_crew=crew if n % 3 == 0 else None,
+            status=rng.random() < 0.5,
+            total=0,
+            date=date(2024, 1, 1) + timedelta(days=n % 365),
+        )
+        for n in range(volumes['orders'])
+    )
+    order_items = []
+    for order in orders:
+        for item in rng.sample(menu_items, min(volumes['items_per_order'], len(menu_items))):
+            order_items.append(OrderItem(order=order, menuitem=item, quantity=1, unit_price=item.price, price=item.price))
+    OrderItem.objects.bulk_create(order_items, batch_size=5000)
+    Order.objects.recompute_totals()
+
+    customer_order = Order.objects.filter(user=customer).order_by('id').first()
+    crew_order = Order.objects.filter(delivery_crew=crew).order_by('id').first()
+
+    return {
+        'tokens': {
+            role: Token.objects.create(user=user).key
+            for role, user in (('admin', admin), ('manager', manager), ('crew', crew), ('customer', customer))
+        },
+        'users': {'admin': admin, 'manager': manager, 'crew': crew, 'customer': customer},
+        'category': categories[0],
+        'menu_items': menu_items,
+        'customer_order': customer_order,
+        'customer_order_item': customer_order.order_items.first(),
+        'crew_order': crew_order,
+        'counter': iter(range(10 ** 9)),
+    }
+
+
+def _new_menu_item(context):
+    n = next(context['counter'])
+    item = MenuItem.objects.create(title=f'Scratch item {n}', price=5, category=context['category'])
+    return {'item': item}
+
+
+def _new_member(group_name):
+    def setup(context):
+        n = next(context['counter'])
+        user = User.objects.create_user(f'bench-member-{n}')
+        user.groups.add(Group.objects.get(name=group_name))
+        return {'user': user}
+    return setup
+
+
+def _new_user(context):
+    n = next(context['counter'])
+    return {'user': User.objects.create_user(f'bench-candidate-{n}')}
+
+
+def _fill_cart(context):
+    customer = context['users']['customer']
+    Cart.objects.filter(user=customer).delete()
+    Cart.objects.bulk_create(
+        Cart(user=customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+        for item in context['menu_items'][:5]
+    )
+    return {}
+
+
+def _new_order(context):
+    order = Order.objects.create(user=context['users']['customer'], total=0, date=date.today())
+    item = OrderItem.objects.create(order=order, menuitem=context['menu_items'][0], quantity=1, unit_price=1, price=1)
+    Order.objects.filter(id=order.id).recompute_totals()
+    return {'order': order, 'order_item': item}
+
+
+def _unassigned_orders(context):
+    orders = Order.objects.bulk_create(
+        Order(user=context['users']['customer'], total=0, date=date.today()) for _ in range(50)
+    )
+    return {'orders': [order.id for order in orders]}
+
+
+def _crew_orders(context):
+    state = _unassigned_orders(context)
+    Order.objects.filter(id__in=state['orders']).update(delivery_crew=context['users']['crew'])
+    return state
+
+
+def _capture(context):
+    # One profiled request, made on first use, serves every iteration.
+    if 'capture' not in context:
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + context['tokens']['admin'])
+        context['capture'] = client.get('/api/categories', HTTP_X_PROFILE='cprofile')['X-Profile-Id']
+    return {'capture': context['capture']}
+
+
+SCENARIOS = [
+    Scenario('categories:list', 'get', '/api/categories', 'customer'),
+    Scenario('categories:create', 'post', '/api/categories', 'admin',
+             data=lambda c, s: {'slug': 'bench', 'title': f"Bench {next(c['counter'])}"}, expect=201),
+    Scenario('menu-items:list', 'get', '/api/menu-items', 'customer'),
+    Scenario('menu-items:filtered', 'get', '/api/menu-items', 'customer',
+             data={'price_from': '5', 'price_to': '30', 'ordering': '-price', 'per_page': 20, 'page': 2}),
+    Scenario('menu-items:search', 'get', '/api/menu-items', 'customer',
+             data={'search': 'item 1', 'category': 'category', 'price_to': '30', 'per_page': 20}),
+    Scenario('menu-items:create', 'post', '/api/menu-items', 'manager',
+             data=lambda c, s: {'title': f"Bench dish {next(c['counter'])}", 'price': '9.50', 'category_id': c['category'].id},
+             expect=201),
+    Scenario('menu-item:get', 'get', lambda c, s: f"/api/menu-items/{c['menu_items'][0].id}", 'customer'),
+    Scenario('menu-item:patch', 'patch', lambda c, s: f"/api/menu-items/{c['menu_items'][1].id}", 'manager',
+             data={'featured': True}),
+    Scenario('menu-item:delete', 'delete', lambda c, s: f"/api/menu-items/{s['item'].id}", 'manager',
+             setup=_new_menu_item, expect=204),
+    Scenario('managers:list', 'get', '/api/groups/manager/users', 'admin'),
+    Scenario('managers:add', 'post', '/api/groups/manager/users', 'admin',
+             setup=_new_user, data=lambda c, s: {'username': s['user'].username}),
+    Scenario('managers:remove', 'delete', lambda c, s: f"/api/groups/manager/users/{s['user'].id}", 'admin',
+             setup=_new_member(MANAGER)),
+    Scenario('delivery-crew:list', 'get', '/api/groups/delivery-crew/users', 'manager'),
+    Scenario('delivery-crew:add', 'post', '/api/groups/delivery-crew/users', 'manager',
+             setup=_new_user, data=lambda c, s: {'username': s['user'].username}),
+    Scenario('delivery-crew:remove', 'delete', lambda c, s: f"/api/groups/delivery-crew/users/{s['user'].id}", 'manager',
+             setup=_new_member(DELIVERY_CREW)),
+    Scenario('cart:list', 'get', '/api/cart/menu-items', 'customer'),
+    Scenario('cart:add', 'post', '/api/cart/menu-items', 'customer',
+             data=lambda c, s: {'menuitemId': c['menu_items'][next(c['counter']) % len(c['menu_items'])].id, 'quantity': 2}),
+    Scenario('cart:add-batch', 'post', '/api/cart/menu-items', 'customer', setup=_fill_cart,
+             data=lambda c, s: {'items': [{'menuitemId': item.id, 'quantity': 3} for item in c['menu_items'][:20]]}),
+    Scenario('cart:empty', 'delete', '/api/cart/menu-items', 'customer', setup=_fill_cart),
+    Scenario('orders:list-manager', 'get', '/api/orders', 'manager', data={'per_page': 50}),
+    Scenario('orders:list-crew', 'get', '/api/orders', 'crew', data={'per_page': 50}),
+    Scenario('orders:list-crew-open', 'get', '/api/orders', 'crew', data={'status': 0, 'ordering': '-date', 'per_page': 50}),
+    Scenario('orders:list-customer', 'get', '/api/orders', 'customer'),
+    Scenario('orders:list-customer-recent', 'get', '/api/orders', 'customer', data={'ordering': '-date', 'per_page': 10}),
+    Scenario('orders:list-manager-open', 'get', '/api/orders', 'manager',
+             data={'status': 0, 'ordering': '-date', 'per_page': 50}),
+    Scenario('orders:checkout', 'post', '/api/orders', 'customer', setup=_fill_cart),
+    Scenario('orders:dispatch', 'post', '/api/orders/dispatch', 'manager', setup=_unassigned_orders,
+             data=lambda c, s: {'orders': s['orders'], 'delivery_crew': c['users']['crew'].id}),
+    Scenario('orders:dispatch-auto', 'post', '/api/orders/dispatch', 'manager', setup=_unassigned_orders,
+             data=lambda c, s: {'orders': s['orders'], 'auto': True}),
+    Scenario('orders:status', 'post', '/api/orders/status', 'manager', setup=_unassigned_orders,
+             data=lambda c, s: {'orders': s['orders'], 'status': 1}),
+    Scenario('orders:status-crew', 'post', '/api/orders/status', 'crew', setup=_crew_orders,
+             data=lambda c, s: {'orders': s['orders'], 'status': 1}),
+    Scenario('orders:export-ndjson', 'get', '/api/orders/export.ndjson', 'manager'),
+    Scenario('orders:export-csv', 'get', '/api/orders/export.csv?status=1', 'manager'),
+    Scenario('order:get', 'get', lambda c, s: f"/api/orders/{c['customer_order'].id}", 'customer'),
+    Scenario('order:put', 'put', lambda c, s: f"/api/orders/{c['crew_order'].id}", 'manager',
+             data=lambda c, s: {'status': 1, 'delivery_crew_id': c['users']['crew'].id}),
+    Scenario('order:patch', 'patch', lambda c, s: f"/api/orders/{c['crew_order'].id}", 'crew', data={'status': 1}),
+    Scenario('order:delete', 'delete', lambda c, s: f"/api/orders/{s['order'].id}", 'manager', setup=_new_order),
+    Scenario('order-item:get', 'get',
+             lambda c, s: f"/api/orders/{c['customer_order'].id}/order-items/{c['customer_order_item'].id}", 'customer'),
+    Scenario('order-item:patch', 'patch',
+             lambda c, s: f"/api/orders/{c['customer_order'].id}/order-items/{c['customer_order_item'].id}", 'customer',
+             data={'quantity': 2}),
+    Scenario('order-item:delete', 'delete',
+             lambda c, s: f"/api/orders/{s['order'].id}/order-items/{s['order_item'].id}", 'customer', setup=_new_order),
+    Scenario('cache-stats', 'get', '/api/cache-stats', 'admin'),
+    Scenario('metrics', 'get', '/api/metrics', 'admin'),
+    Scenario('profiles:list', 'get', '/api/profiles', 'admin', setup=_capture),
+    Scenario('profiles:get', 'get', lambda c, s: f"/api/profiles/{s['capture']}.json", 'admin', setup=_capture),
+]
+
+
+# Scenarios with an async variant in asyncviews.py.
+READ_SCENARIOS = ['categories:list', 'menu-items:list', 'menu-item:get', 'orders:list-customer', 'order:get']
+
+
+@contextmanager
+def read_views(async_views):
+    """Route the read endpoints to the async views (or back to the sync ones) for the body."""
+    def route():
+        importlib.reload(importlib.import_module('LittleLemonAPI.urls'))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    try:
+        with override_settings(ASYNC_READ_VIEWS=async_views):
+            route()
+            yield
+    finally:
+        route()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def client_for(scenario, context):
+    """
+    A function sending one request of ``scenario`` and returning the
+    response. It takes the ``(path, data)`` of ``scenario.request()``, so
+    callers run the setup outside whatever they measure.
+    """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Token ' + context['tokens'][scenario.role])
+    send = getattr(client, scenario.method)
+
+    def call(path, data):
+        response = send(path, data, format='json')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+    return call
+
+
+def async_client_for(scenario, context):
+    """``client_for`` for the ASGI handler: the function returns a coroutine."""
+    client = AsyncClient()
+    send = getattr(client, scenario.method)
+    headers = {'Authorization': 'Token ' + context['tokens'][scenario.role]}
+
+    async def call(path, data):
+        return await send(path, data, headers=headers)
+    return call
+
+
+def capture_queries(scenario, context):
+    """The SQL one warm request of ``scenario`` issues on the default database."""
+    call = client_for(scenario, context)
+    call(*scenario.request(context))
+    request = scenario.request(context)
+    with CaptureQueriesContext(connection) as captured:
+        call(*request)
+    return [query['sql'] for query in captured]
+
+
+def run_scenario(scenario, context, iterations, profile_iterations, cold_cache=False):
+    send = client_for(scenario, context)
+
+    def prepare():
+        # The setup is neither timed nor counted.
+        request = scenario.request(context)
+        if cold_cache:
+            cache.clear()
+        return request
+
+    # Warm-up: first-request costs (URL resolution, caches) are not measured.
+    send(*prepare())
+
+    latencies = []
+    errors = 0
+    for _ in range(iterations):
+        request = prepare()
+        started = time.perf_counter()
+        response = send(*request)
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != scenario.expect:
+            errors += 1
+
+    # Query counting and allocation tracking distort latency, so they get a
+    # separate, shorter pass.
+    queries = []
+    peak = None
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(profile_iterations):
+        request = prepare()
+        tracemalloc.reset_peak()
+        with CaptureQueriesContext(connection) as captured:
+            send(*request)
+        queries.append(len(captured))
+        peak = max(peak or 0, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    return {
+        'endpoint': scenario.name,
+        'method': scenario.method.upper(),
+        'iterations': iterations,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'throughput_rps': len(latencies) / sum(latencies),
+        'queries': statistics.fmean(queries) if queries else None,
+        'peak_memory_kb': peak / 1024 if peak is not None else None,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Yield (endpoint, metric, before, after, change) for every metric that
+    got worse than the baseline by more than ``threshold`` (a fraction).
+    """
+    previous = {row['endpoint']: row for row in baseline['results']}
+    for row in results['results']:
+        before = previous.get(row['endpoint'])
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_memory_kb'):
+            if before.get(metric) in (None, 0) or row.get(metric) is None:
+                continue
+            change = (row[metric] - before[metric]) / before[metric]
+            if change > threshold:
+                yield row['endpoint'], metric, before[metric], row[metric], change
+
+
+def dump(results, path):
+    with open(path, 'w') as output:
+        json.dump(results, output, indent=2)
@@ -0,0 +1,89 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from LittleLemon.db.routers import pin_to_primary
+from .shared import counters
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+class CacheStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+catalog_stats = CacheStats()
+
+
+def catalog_version():
+    # The version lives in the shared counter file rather than the cache,
+    # which is local to each worker process: a write handled by one worker
+    # moves every worker on to new keys.
+    # Seeding from the clock keeps a re-created counter ahead of any
+    # entries cached under the version that was lost.
+    return counters.get(CATALOG_VERSION_KEY, time.time_ns())
+
+
+def bump_catalog_version():
+    return counters.incr(CATALOG_VERSION_KEY, time.time_ns())
+
+
+def _digest(params):
+    return hashlib.sha1(repr(params).encode()).hexdigest()
+
+
+def catalog_key(prefix, params, version):
+    return f'{prefix}:{version}:{_digest(params)}'
+
+
+def catalog_validators(prefix, params, version=None):
+    """
+    Return the ETag for a catalog response. It changes on every catalog
+    write, in every worker, so it needs no response body; there is no
+    Last-Modified (see conditional.py).
+
+    Pass the ``version`` the response is read under when the caller also
+    looks the page up with get_catalog(), so the ETag and the cached page
+    agree even if a write lands in between.
+    """
+    if version is None:
+        version = catalog_version()
+    return f'"{prefix}-{version}-{_digest(params)[:16]}"'
+
+
+def get_catalog(prefix, params, version=None):
+    if version is None:
+        version = catalog_version()
+    key = catalog_key(prefix, params, version)
+    data = cache.get(key)
+    if data is None:
+        catalog_stats.miss()
+        # The fill is cached until the next catalog write, so it must not be
+        # read from a replica that may not have that write yet.
+        pin_to_primary()
+    else:
+        catalog_stats.hit()
+    return key, data
+
+
+def set_catalog(key, data):
+    # Entries never expire: a catalog write bumps the shared version and
+    # orphans them in every process.
+    cache.set(key, data, timeout=None)
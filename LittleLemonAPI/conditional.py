@@ -0,0 +1,41 @@
+"""
+Conditional GET support.
+
+Views compute an ETag from cheap stamps, answer ``If-None-Match`` with a
+304 before touching the queryset, and otherwise attach the ETag to the
+full response. No Last-Modified is sent: with whole-second resolution, a
+client that fetched between two writes in the same second would keep
+getting 304s for the older copy.
+Only JSON responses are validated: the browsable API page differs per
+user and per visit.
+"""
+from django.utils.cache import get_conditional_response
+
+
+def order_validators(order):
+    return f'"order-{order.pk}-{order.updated:%Y%m%d%H%M%S%f}"'
+
+
+def _validates(request):
+    return request.method in ('GET', 'HEAD') and request.accepted_renderer.format == 'json'
+
+
+def set_validators(response, etag):
+    response['ETag'] = etag
+    return response
+
+
+def not_modified(request, etag):
+    """Return a 304 (or 412) response when the client's copy is current, else None."""
+    if not _validates(request):
+        return None
+    response = get_conditional_response(request._request, etag=etag)
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+def with_validators(request, response, etag):
+    if _validates(request) and response.status_code == 200:
+        set_validators(response, etag)
+    return response
@@ -0,0 +1,201 @@
+"""
+Deterministic bulk data generation for load and scaling tests.
+
+Rows are built chunk by chunk as plain tuples with explicit primary keys
+and committed one chunk per transaction, so memory stays flat however
+many rows are requested. Each table draws from its own ``random.Random``
+seeded from the run seed, so the same seed and volumes always produce the
+same data.
+
+Rows go in through batched ``executemany`` rather than ``bulk_create``:
+on SQLite Django caps a bulk insert at 999 parameters and prepares every
+field of every instance, which tops out around 13k rows/s.
+"""
+import random
+import time
+from array import array
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User, Group
+from django.db import connection, transaction
+from django.db.models import Max
+
+from .cache import bump_catalog_version
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .roles import MANAGER, DELIVERY_CREW, membership_changed
+
+
+# A valid "unusable password" marker: hashing a real password per user
+# would dominate generation time.
+UNUSABLE_PASSWORD = '!generated'
+
+JOINED = '2024-01-01 00:00:00'
+
+
+class DataGenerator:
+
+    def __init__(self, seed=0, batch_size=5000, chunk_size=50000, start_date=date(2024, 1, 1), days=365, log=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.start_date = start_date
+        self.days = days
+        self.log = log or (lambda message: None)
+
+    def _rng(self, table):
+        return random.Random(f'{self.seed}:{table}')
+
+    def _next_id(self, model):
+        return (model.objects.aggregate(high=Max('id'))['high'] or 0) + 1
+
+    def _insert(self, model, columns, rows):
+        quote = connection.ops.quote_name
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
+        return len(rows)
+
+    def _write(self, label, count, build):
+        """
+        Call ``build(start, stop)`` for consecutive slices of ``range(count)``
+        and commit each slice in its own transaction.
+        """
+        started = time.perf_counter()
+        written = 0
+        for start in range(0, count, self.chunk_size):
+            stop = min(count, start + self.chunk_size)
+            with transaction.atomic():
+                written += build(start, stop)
+            elapsed = time.perf_counter() - started
+            self.log(f"{label}: {stop:,}/{count:,} ({written / elapsed:,.0f} rows/s)")
+        return written
+
+    def _price(self, rng):
+        return Decimal(rng.randint(100, 5000)) / 100
+
+    def categories(self, count):
+        first = self._next_id(Category)
+
+        def build(start, stop):
+            rows = [(first + n, f'category-{first + n}', f'Category {first + n}') for n in range(start, stop)]
+            return self._insert(Category, ('id', 'slug', 'title'), rows)
+
+        written = self._write('categories', count, build)
+        bump_catalog_version()
+        return written
+
+    def menu_items(self, count, featured=0.1):
+        rng = self._rng('menu_items')
+        categories = array('q', Category.objects.order_by('id').values_list('id', flat=True))
+        first = self._next_id(MenuItem)
+
+        def build(start, stop):
+            rows = [
+                (first + n, f'Menu item {first + n}', str(self._price(rng)), rng.random() < featured, rng.choice(categories))
+                for n in range(start, stop)
+            ]
+            return self._insert(MenuItem, ('id', 'title', 'price', 'featured', 'category_id'), rows)
+
+        written = self._write('menu items', count, build)
+        bump_catalog_version()
+        return written
+
+    def users(self, count, managers=0.001, crew=0.01):
+        rng = self._rng('users')
+        manager_group = Group.objects.get_or_create(name=MANAGER)[0].id
+        crew_group = Group.objects.get_or_create(name=DELIVERY_CREW)[0].id
+        membership = User.groups.through
+        first = self._next_id(User)
+
+        def build(start, stop):
+            rows = []
+            groups = []
+            for n in range(start, stop):
+                pk = first + n
+                rows.append((pk, f'user{pk}', f'user{pk}@example.com', UNUSABLE_PASSWORD, '', '', False, False, True, JOINED))
+                roll = rng.random()
+                if roll < managers:
+                    groups.append((pk, manager_group))
+                elif roll < managers + crew:
+                    groups.append((pk, crew_group))
+            self._insert(User, (
+                'id', 'username', 'email', 'password', 'first_name', 'last_name',
+                'is_superuser', 'is_staff', 'is_active', 'date_joined',
+            ), rows)
+            self._insert(membership, ('user_id', 'group_id'), groups)
+            return len(rows)
+
+        written = self._write('users', count, build)
+        membership_changed()
+        return written
+
+    def carts(self, count, items_per_cart=3):
+        """
+        Write ``count`` cart rows for users that have none yet,
+        ``items_per_cart`` distinct menu items each (fewer in the last
+        cart), so the (menuitem, user) constraint always holds.
+        """
+        rng = self._rng('carts')
+        menu = list(MenuItem.objects.order_by('id').values_list('id', 'price'))
+        items_per_cart = min(items_per_cart, len(menu))
+        if not items_per_cart:
+            return 0
+        users = array('q', User.objects.filter(cart__isnull=True).order_by('id').values_list('id', flat=True)[:-(-count // items_per_cart)])
+        next_cart = [self._next_id(Cart)]
+
+        def build(start, stop):
+            rows = []
+            for n in range(start, stop):
+                user_id = users[n]
+                for menuitem_id, price in rng.sample(menu, min(items_per_cart, count - n * items_per_cart)):
+                    quantity = rng.randint(1, 4)
+                    rows.append((next_cart[0], user_id, menuitem_id, quantity, str(price), str(price * quantity)))
+                    next_cart[0] += 1
+            return self._insert(Cart, ('id', 'user_id', 'menuitem_id', 'quantity', 'unit_price', 'price'), rows)
+
+        return self._write('carts', len(users), build)
+
+    def orders(self, count, items_per_order=3, assigned=0.7, delivered=0.5):
+        """
+        Create ``count`` orders averaging ``items_per_order`` distinct lines
+        each. Totals are the exact sum of the generated lines; with an
+        empty menu or ``items_per_order=0`` the orders have no lines.
+        """
+        rng = self._rng('orders')
+        menu = list(MenuItem.objects.order_by('id').values_list('id', 'price'))
+        users = array('q', User.objects.order_by('id').values_list('id', flat=True))
+        crew = array('q', User.objects.filter(groups__name=DELIVERY_CREW).order_by('id').values_list('id', flat=True))
+        most = max(0, min(len(menu), 2 * items_per_order - 1))
+        first_order = self._next_id(Order)
+        next_item = [self._next_id(OrderItem)]
+
+        def build(start, stop):
+            orders = []
+            lines = []
+            for n in range(start, stop):
+                order_id = first_order + n
+                total = Decimal(0)
+                for menuitem_id, price in rng.sample(menu, rng.randint(min(1, most), most)):
+                    quantity = rng.randint(1, 3)
+                    total += price * quantity
+                    lines.append((next_item[0], order_id, menuitem_id, quantity, str(price), str(price * quantity)))
+                    next_item[0] += 1
+                orders.append((
+                    order_id,
+                    rng.choice(users),
+                    rng.choice(crew) if crew and rng.random() < assigned else None,
+                    rng.random() < delivered,
+                    str(total),
+                    (self.start_date + timedelta(days=rng.randrange(self.days))).isoformat(),
+                ))
+            self._insert(Order, ('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date'), orders)
+            self._insert(OrderItem, ('id', 'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price'), lines)
+            return len(orders) + len(lines)
+
+        return self._write('orders', count, build)
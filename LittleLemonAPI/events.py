@@ -0,0 +1,272 @@
+"""
+Order change events pushed to ``GET /api/orders/events`` (Server-Sent Events).
+
+``SingleOrderView.put``/``patch`` publish an event once the change is
+committed. The broker hands it to the streams of the order's customer and
+delivery crew connected to this process; the backend gives it its id,
+keeps recent events for clients resuming with ``Last-Event-ID`` and, for
+``SQLiteEventBackend``, carries it to the other worker processes.
+
+Backends do blocking I/O: async code reads the history and publishes
+through ``shared.offload`` (``Broker.apublish``) rather than on the loop.
+"""
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.asyncio import async_unsafe
+from django.utils.module_loading import import_string
+
+from .shared import offload
+
+
+Event = namedtuple('Event', 'id kind data users')
+
+
+def encode(event):
+    return f"id: {event.id}\nevent: {event.kind}\ndata: {json.dumps(event.data, separators=(',', ':'))}\n\n".encode()
+
+
+class LocalBackend:
+    """Events reach only the streams connected to this process."""
+
+    def __init__(self, options):
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=options.get('HISTORY', 1000))
+        # Seeding from the clock keeps ids ahead of those handed out before
+        # a restart, so a resuming client is not sent old events again.
+        self._ids = itertools.count(time.time_ns() // 1000)
+
+    def publish(self, kind, data, users):
+        with self._lock:
+            event = Event(next(self._ids), kind, data, users)
+            self._history.append(event)
+        return event
+
+    def since(self, last_id, user_id):
+        with self._lock:
+            return [event for event in self._history if event.id > last_id and user_id in event.users]
+
+    def listen(self, deliver):
+        pass
+
+
+class SQLiteEventBackend:
+    """
+    Events appended to a WAL-mode SQLite file shared by every worker
+    process on the host; each process polls it for the others' events.
+    """
+
+    def __init__(self, options):
+        self.path = str(options.get('PATH', settings.BASE_DIR / 'events.sqlite3'))
+        self.history = options.get('HISTORY', 1000)
+        self.poll_interval = options.get('POLL_INTERVAL', 0.5)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS order_event ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, pid INTEGER NOT NULL, '
+                'kind TEXT NOT NULL, data TEXT NOT NULL, users TEXT NOT NULL)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _event(row):
+        id, kind, data, users = row
+        return Event(id, kind, json.loads(data), tuple(json.loads(users)))
+
+    @async_unsafe
+    def publish(self, kind, data, users):
+        connection = self._connection()
+        id = connection.execute(
+            'INSERT INTO order_event (pid, kind, data, users) VALUES (?, ?, ?, ?) RETURNING id',
+            (os.getpid(), kind, json.dumps(data), json.dumps(users)),
+        ).fetchone()[0]
+        connection.execute('DELETE FROM order_event WHERE id <= ?', (id - self.history,))
+        return Event(id, kind, data, users)
+
+    @async_unsafe
+    def since(self, last_id, user_id):
+        rows = self._connection().execute(
+            'SELECT id, kind, data, users FROM order_event WHERE id > ? ORDER BY id', (last_id,),
+        )
+        return [event for event in map(self._event, rows) if user_id in event.users]
+
+    def listen(self, deliver):
+        threading.Thread(target=self._poll, args=(deliver,), name='order-events', daemon=True).start()
+
+    def _poll(self, deliver):
+        connection = self._connection()
+        last_id = connection.execute('SELECT COALESCE(MAX(id), 0) FROM order_event').fetchone()[0]
+        while True:
+            time.sleep(self.poll_interval)
+            rows = connection.execute(
+                'SELECT id, pid, kind, data, users FROM order_event WHERE id > ? ORDER BY id', (last_id,),
+            ).fetchall()
+            for id, pid, *event in rows:
+                last_id = id
+                # Events published here were delivered when they were published.
+                if pid != os.getpid():
+                    deliver(self._event((id, *event)))
+
+
+class Subscription:
+    """One connected stream: a bounded queue fed from any thread."""
+
+    def __init__(self, user_id, size):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(size)
+        # Set when the client falls behind; its stream ends and it resumes
+        # from the last id it received.
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's event loop has shut down.
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class Broker:
+
+    def __init__(self, backend, queue_size=100):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        self._listening = False
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+            listen, self._listening = not self._listening, True
+        if listen:
+            self.backend.listen(self.deliver)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, kind, data, users):
+        event = self.backend.publish(kind, data, tuple(dict.fromkeys(users)))
+        self.deliver(event)
+        return event
+
+    async def apublish(self, kind, data, users):
+        return await offload(self.publish)(kind, data, users)
+
+    def deliver(self, event):
+        with self._lock:
+            subscriptions = [subscription for user_id in event.users for subscription in self._subscriptions.get(user_id, ())]
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def connected(self):
+        with self._lock:
+            return sum(map(len, self._subscriptions.values()))
+
+
+_options = getattr(settings, 'ORDER_EVENTS', {})
+broker = Broker(
+    import_string(_options.get('BACKEND', 'LittleLemonAPI.events.LocalBackend'))(_options),
+    queue_size=_options.get('QUEUE_SIZE', 100),
+)
+
+
+def order_state(order):
+    status = order._meta.get_field('status').to_python(order.status)
+    return {'status': status, 'delivery_crew': order.delivery_crew_id}
+
+
+def _changed(order_id, user_id, previous, current, updated):
+    changed = [field for field in current if current[field] != previous[field]]
+    if not changed:
+        return
+    data = {'order': order_id, **current, 'changed': changed, 'updated': updated.isoformat()}
+    users = [user_id, current['delivery_crew'], previous['delivery_crew']]
+    transaction.on_commit(partial(broker.publish, 'order', data, [user for user in users if user is not None]))
+
+
+def order_changed(order, previous):
+    """
+    Publish an ``order`` event, once the current transaction commits, if
+    the status or crew of ``order`` differs from ``previous`` (an
+    ``order_state``). The previous crew member is told they were taken off.
+    """
+    _changed(order.pk, order.user_id, previous, order_state(order), order.updated)
+
+
+def rows_changed(rows, changes, updated):
+    """
+    ``order_changed`` for orders changed with ``update(**changes)``;
+    ``rows`` are their ``values('id', 'user', 'status', 'delivery_crew')``
+    from before the update.
+    """
+    for row in rows:
+        previous = {'status': row['status'], 'delivery_crew': row['delivery_crew']}
+        _changed(row['id'], row['user'], previous, {**previous, **changes}, updated)
+
+
+def last_event_id(request):
+    """The id a reconnecting client last received, or None."""
+    value = request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def stream(user_id, last_id, heartbeat):
+    """
+    The SSE body for ``user_id``: the events after ``last_id`` still in
+    the backend's history, then live ones until the client goes away.
+    """
+    # Subscribed before the replay is read, so nothing falls in between.
+    subscription = broker.subscribe(user_id)
+    try:
+        yield b'retry: 3000\n\n'
+        replayed = set()
+        history = await offload(broker.backend.since)(last_id, user_id) if last_id is not None else ()
+        for event in history:
+            replayed.add(event.id)
+            yield encode(event)
+        while not subscription.overflowed:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if event.id not in replayed:
+                yield encode(event)
+    finally:
+        broker.unsubscribe(subscription)
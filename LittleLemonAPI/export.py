@@ -0,0 +1,101 @@
+"""
+Streaming order exports.
+
+Orders are read with ``.iterator()`` a chunk at a time, and the items of
+each chunk are fetched with one range query. Each chunk is encoded and
+yielded before the next is read, so memory depends on the chunk size
+rather than on the number of orders exported.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from itertools import islice
+
+from .models import Order, OrderItem
+
+
+ORDER_FIELDS = ('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date')
+ITEM_FIELDS = ('id', 'order_id', 'menuitem_id', 'quantity', 'unit_price', 'price')
+
+CSV_HEADER = (
+    'order_id', 'user', 'delivery_crew', 'status', 'total', 'date',
+    'item_id', 'menuitem', 'quantity', 'unit_price', 'price',
+)
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def order_chunks(filters, chunk_size=1000):
+    """
+    Yield lists of ``(order_row, item_rows)`` for orders matching
+    ``filters`` (keyword lookups on Order), in id order.
+    """
+    rows = Order.objects.filter(**filters).order_by('id').values_list(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    item_filters = {f'order__{lookup}': value for lookup, value in filters.items()}
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        items = defaultdict(list)
+        lines = (
+            OrderItem.objects.filter(order__gte=chunk[0][0], order__lte=chunk[-1][0], **item_filters)
+            .order_by('order_id', 'id')
+            .values_list(*ITEM_FIELDS)
+        )
+        for line in lines:
+            items[line[1]].append(line)
+        yield [(order, items[order[0]]) for order in chunk]
+
+
+def ndjson_stream(filters, chunk_size=1000):
+    for chunk in order_chunks(filters, chunk_size):
+        yield ''.join(
+            json.dumps({
+                'id': order_id,
+                'user': user_id,
+                'delivery_crew': crew_id,
+                'status': status,
+                'total': str(total),
+                'date': date.isoformat(),
+                'order_items': [
+                    {
+                        'id': item_id,
+                        'order': order_id,
+                        'menuitem': menuitem_id,
+                        'quantity': quantity,
+                        'unit_price': str(unit_price),
+                        'price': str(price),
+                    }
+                    for item_id, _, menuitem_id, quantity, unit_price, price in items
+                ],
+            }) + '\n'
+            for (order_id, user_id, crew_id, status, total, date), items in chunk
+        )
+
+
+def csv_stream(filters, chunk_size=1000):
+    """One row per order item; orders without items get one row with blank item columns."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    yield buffer.getvalue()
+    for chunk in order_chunks(filters, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        for order, items in chunk:
+            order = (order[0], order[1], order[2], int(order[3]), order[4], order[5].isoformat())
+            if not items:
+                writer.writerow(order + ('',) * 5)
+            for item_id, _, menuitem_id, quantity, unit_price, price in items:
+                writer.writerow(order + (item_id, menuitem_id, quantity, unit_price, price))
+        yield buffer.getvalue()
+
+
+STREAMS = {
+    'ndjson': ndjson_stream,
+    'csv': csv_stream,
+}
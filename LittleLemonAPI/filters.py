@@ -0,0 +1,218 @@
+"""
+Declarative parsing of listing parameters.
+
+A ``FilterSet`` subclass declares the parameters a listing accepts. They
+are read from the query string (falling back to the request body for
+older clients), validated up front and turned into queryset filters, an
+ordering and a canonical ``cache_key()`` shared by every spelling of the
+same logical query.
+"""
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from . import search
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+def decimal(value):
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(value)
+    if not value.is_finite():
+        raise ValueError(value)
+    return value
+
+
+def integer(value):
+    # A JSON integer or its string form; bools and floats such as 1.9 are
+    # rejected rather than truncated.
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(value)
+    return int(value)
+
+
+def positive_int(value):
+    value = integer(value)
+    if value < 1:
+        raise ValueError(value)
+    return value
+
+
+def boolean(value):
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 't'):
+        return True
+    if value in ('0', 'false', 'f'):
+        return False
+    raise ValueError(value)
+
+
+class Filter:
+
+    def __init__(self, parse=str, lookup=None, default=None):
+        self.parse = parse
+        self.lookup = lookup
+        self.default = default
+
+    def clean(self, raw):
+        if raw is None or raw == '':
+            return self.default
+        try:
+            return self.parse(raw)
+        except (TypeError, ValueError):
+            raise InvalidFilter('Value error')
+
+    def canonical(self, value):
+        return value.normalize() if isinstance(value, Decimal) else value
+
+    def lookups(self, value):
+        if self.lookup is None or value is None:
+            return {}
+        return {self.lookup: value}
+
+    def apply(self, queryset, value):
+        lookups = self.lookups(value)
+        return queryset.filter(**lookups) if lookups else queryset
+
+
+class BooleanFilter(Filter):
+    """
+    Filters with ``field IN (value)``: Django writes a boolean ``exact``
+    as the bare column (or ``NOT column``), which SQLite cannot answer
+    from an index.
+    """
+
+    def __init__(self, field):
+        super().__init__(boolean, lookup=f'{field}__in')
+
+    def lookups(self, value):
+        return {} if value is None else {self.lookup: [value]}
+
+
+class OrderingFilter(Filter):
+    """Comma-separated field names, each optionally prefixed with '-'."""
+
+    def __init__(self, fields):
+        super().__init__(default=())
+        self.fields = frozenset(fields)
+
+    def clean(self, raw):
+        if raw is None or raw == '':
+            return self.default
+        ordering = []
+        seen = set()
+        for name in str(raw).split(','):
+            name = name.strip()
+            if name.lstrip('-') not in self.fields:
+                raise InvalidFilter('Field error')
+            if name.lstrip('-') not in seen:
+                seen.add(name.lstrip('-'))
+                ordering.append(name)
+        return tuple(ordering)
+
+    def apply(self, queryset, value):
+        return queryset.order_by(*value) if value else queryset
+
+
+class SearchFilter(Filter):
+    """
+    Token-prefix match through the full-text index, restricted to one
+    index column if ``column`` is set. With ``rank`` the best matches come
+    first unless an explicit ordering overrides it.
+    """
+
+    def __init__(self, column=None, rank=False, fallback=None):
+        super().__init__(search.terms)
+        self.column = column
+        self.rank = rank
+        self.fallback = fallback
+
+    def apply(self, queryset, value):
+        if value is None:
+            return queryset
+        if not search.supported(queryset):
+            for term in value:
+                queryset = queryset.filter(**{self.fallback: term})
+            return queryset
+        queryset = search.matching(queryset, value, self.column)
+        return search.ranked(queryset, value) if self.rank else queryset
+
+
+class FilterSet:
+
+    filters = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.filters = dict(cls.filters)
+        cls.filters.update((name, value) for name, value in vars(cls).items() if isinstance(value, Filter))
+
+    def __init__(self, request):
+        body = request.data if hasattr(request.data, 'get') else {}
+        self.values = {}
+        for name, declared in self.filters.items():
+            raw = request.query_params.get(name)
+            if raw is None:
+                raw = body.get(name)
+            self.values[name] = declared.clean(raw)
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def filter(self, queryset):
+        for name, declared in self.filters.items():
+            queryset = declared.apply(queryset, self.values[name])
+        return queryset
+
+    def lookups(self):
+        """The keyword lookups of the plain filters, for querysets built by hand."""
+        lookups = {}
+        for name, declared in self.filters.items():
+            lookups.update(declared.lookups(self.values[name]))
+        return lookups
+
+    def cache_key(self):
+        return tuple(sorted(
+            (name, self.filters[name].canonical(value))
+            for name, value in self.values.items()
+            if value != self.filters[name].default
+        ))
+
+
+class MenuItemFilter(FilterSet):
+    search = SearchFilter(rank=True, fallback='title__icontains')
+    category = SearchFilter(column='category', fallback='category__title__icontains')
+    price_from = Filter(decimal, lookup='price__gte')
+    price_to = Filter(decimal, lookup='price__lte')
+    ordering = OrderingFilter(['id', 'title', 'price', 'featured', 'category', 'category__title'])
+    page = Filter(positive_int, default=1)
+    per_page = Filter(positive_int)
+
+
+class OrderFilter(FilterSet):
+    status = BooleanFilter('status')
+    ordering = OrderingFilter(['id', 'user', 'delivery_crew', 'status', 'total', 'date'])
+    page = Filter(positive_int, default=1)
+    per_page = Filter(positive_int)
+
+
+class OrderExportFilter(FilterSet):
+    status = BooleanFilter('status')
+    delivery_crew = Filter(integer, lookup='delivery_crew')
+    date_from = Filter(date.fromisoformat, lookup='date__gte')
+    date_to = Filter(date.fromisoformat, lookup='date__lte')
+
+
+class OrderDispatchFilter(FilterSet):
+    status = BooleanFilter('status')
+    unassigned = Filter(boolean, lookup='delivery_crew__isnull')
+    customer = Filter(positive_int, lookup='user')
+    date_from = Filter(date.fromisoformat, lookup='date__gte')
+    date_to = Filter(date.fromisoformat, lookup='date__lte')
+
+    def given(self):
+        return any(value is not None for value in self.values.values())
@@ -0,0 +1,111 @@
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from LittleLemonAPI import benchmark
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway database and benchmark every API route (latency percentiles, throughput, queries, memory)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50, help="Timed requests per endpoint.")
+        parser.add_argument('--profile-iterations', type=int, default=5, help="Requests per endpoint used for query and memory measurement.")
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only run endpoints whose name starts with this prefix.")
+        parser.add_argument('--cold-cache', action='store_true', help="Clear the Django cache before every request.")
+        parser.add_argument(
+            '--serializers', choices=['fast', 'drf', 'both'], default='fast',
+            help="List responses from row serializers (fast), DRF serializers (drf) or run each endpoint with both.",
+        )
+        parser.add_argument('--output', help="Write machine-readable results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare against a previous --output file.")
+        parser.add_argument('--threshold', type=float, default=0.10, help="Regression threshold as a fraction (default 0.10).")
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in benchmark.SCENARIOS
+            if not options['endpoints'] or any(scenario.name.startswith(prefix) for prefix in options['endpoints'])
+        ]
+        if not scenarios:
+            raise CommandError("No endpoint matches --endpoint.")
+
+        volumes = {
+            'categories': options['categories'],
+            'menu_items': options['menu_items'],
+            'users': options['users'],
+            'carts': options['carts'],
+            'orders': options['orders'],
+            'items_per_order': options['items_per_order'],
+        }
+
+        with benchmark.environment():
+            started = time.perf_counter()
+            context = benchmark.seed(volumes, seed=options['seed'])
+            self.stderr.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+            modes = {'fast': [True], 'drf': [False], 'both': [True, False]}[options['serializers']]
+            rows = []
+            for scenario in scenarios:
+                for fast in modes:
+                    with override_settings(FAST_SERIALIZERS=fast):
+                        row = benchmark.run_scenario(
+                            scenario, context, options['iterations'], options['profile_iterations'], options['cold_cache'],
+                        )
+                    if len(modes) > 1 and not fast:
+                        row['endpoint'] += ' [drf]'
+                    rows.append(row)
+                    self.stderr.write(f"  {row['endpoint']}: p50 {row['p50_ms']:.2f} ms")
+
+        results = {
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'volumes': volumes,
+                'iterations': options['iterations'],
+                'cold_cache': options['cold_cache'],
+                'serializers': options['serializers'],
+            },
+            'results': rows,
+        }
+
+        self.print_table(rows)
+
+        if options['output']:
+            benchmark.dump(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = list(benchmark.compare(results, baseline, options['threshold']))
+            for endpoint, metric, before, after, change in regressions:
+                self.stdout.write(self.style.WARNING(
+                    f"REGRESSION {endpoint} {metric}: {before:.2f} -> {after:.2f} ({change:+.0%})"
+                ))
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS(f"No regressions above {options['threshold']:.0%}."))
+
+    def print_table(self, rows):
+        header = f"{'endpoint':<34} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8} {'peak KB':>9} {'errors':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            # Queries and memory are not measured with --profile-iterations 0.
+            queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+            peak = '-' if row['peak_memory_kb'] is None else f"{row['peak_memory_kb']:.0f}"
+            self.stdout.write(
+                f"{row['endpoint']:<34} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['throughput_rps']:>8.0f} {queries:>8} {peak:>9} {row['errors']:>6}"
+            )
@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+
+from LittleLemonAPI import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and drive the read endpoints with many concurrent connections, "
+        "once through the WSGI handler with a fixed pool of worker threads and once through the "
+        "ASGI handler with the async read views."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--connections', type=int, default=1000, help="Concurrent connections, each sending requests back to back.")
+        parser.add_argument('--requests', type=int, default=5000, help="Requests per endpoint and mode.")
+        parser.add_argument('--wsgi-threads', type=int, default=32, help="Worker threads serving the WSGI side.")
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only run endpoints whose name starts with this prefix.")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in benchmark.SCENARIOS
+            if scenario.name in benchmark.READ_SCENARIOS
+            and (not options['endpoints'] or any(scenario.name.startswith(prefix) for prefix in options['endpoints']))
+        ]
+        if not scenarios:
+            raise CommandError("No read endpoint matches --endpoint.")
+
+        volumes = {
+            'categories': options['categories'],
+            'menu_items': options['menu_items'],
+            'users': options['users'],
+            'carts': options['carts'],
+            'orders': options['orders'],
+            'items_per_order': options['items_per_order'],
+        }
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        connections, requests = options['connections'], options['requests']
+
+        with benchmark.environment():
+            context = benchmark.seed(volumes, seed=options['seed'])
+            rows = []
+            for scenario in scenarios:
+                for mode in modes:
+                    if mode == 'wsgi':
+                        row = self.run_wsgi(scenario, context, connections, requests, options['wsgi_threads'])
+                    else:
+                        with benchmark.read_views(True):
+                            row = async_to_sync(self.run_asgi)(scenario, context, connections, requests)
+                    row.update(endpoint=scenario.name, mode=mode)
+                    rows.append(row)
+                    self.stderr.write(f"  {scenario.name} [{mode}]: p50 {row['p50_ms']:.1f} ms, {row['throughput_rps']:.0f} req/s")
+
+        self.print_table(rows)
+
+    def run_wsgi(self, scenario, context, connections, requests, threads):
+        """
+        Each connection sends its next request when the last one returns;
+        time spent queued for a free worker thread counts towards latency.
+        """
+        local = threading.local()
+
+        def send(request, queued):
+            if not hasattr(local, 'call'):
+                local.call = benchmark.client_for(scenario, context)
+            try:
+                status = local.call(*request).status_code
+            except Exception:
+                status = None
+            return time.perf_counter() - queued, status
+
+        def submit(pool):
+            # The scenario's setup runs before the request is queued.
+            request = scenario.request(context)
+            return pool.submit(send, request, time.perf_counter())
+
+        send(scenario.request(context), time.perf_counter())
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            pending = {submit(pool) for _ in range(min(connections, requests))}
+            sent = len(pending)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    elapsed, status = future.result()
+                    latencies.append(elapsed)
+                    errors += status != scenario.expect
+                    if sent < requests:
+                        pending.add(submit(pool))
+                        sent += 1
+        return self.summary(latencies, errors, time.perf_counter() - started)
+
+    async def run_asgi(self, scenario, context, connections, requests):
+        call = benchmark.async_client_for(scenario, context)
+        latencies, errors = [], 0
+        remaining = requests
+
+        async def connect():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                request = scenario.request(context)
+                queued = time.perf_counter()
+                try:
+                    status = (await call(*request)).status_code
+                except Exception:
+                    status = None
+                latencies.append(time.perf_counter() - queued)
+                errors += status != scenario.expect
+
+        # Warm-up: URL resolution and the first query are not measured.
+        await call(*scenario.request(context))
+        started = time.perf_counter()
+        await asyncio.gather(*(connect() for _ in range(min(connections, requests))))
+        return self.summary(latencies, errors, time.perf_counter() - started)
+
+    @staticmethod
+    def summary(latencies, errors, wall):
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'p50_ms': benchmark.percentile(latencies, 0.50) * 1000,
+            'p95_ms': benchmark.percentile(latencies, 0.95) * 1000,
+            'p99_ms': benchmark.percentile(latencies, 0.99) * 1000,
+            'throughput_rps': len(latencies) / wall,
+        }
+
+    def print_table(self, rows):
+        header = f"{'endpoint':<22} {'mode':<5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'errors':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for row in rows:
+            self.stdout.write(
+                f"{row['endpoint']:<22} {row['mode']:<5} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+                f"{row['p99_ms']:>9.1f} {row['throughput_rps']:>8.0f} {row['errors']:>6}"
+            )
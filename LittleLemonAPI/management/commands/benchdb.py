@@ -0,0 +1,151 @@
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+SCHEMA = """
+CREATE TABLE category (id INTEGER PRIMARY KEY, slug TEXT, title TEXT);
+CREATE TABLE menuitem (id INTEGER PRIMARY KEY, title TEXT, price DECIMAL, featured BOOL, category_id INTEGER REFERENCES category (id));
+CREATE INDEX menuitem_price ON menuitem (price);
+CREATE TABLE cart (id INTEGER PRIMARY KEY, user_id INTEGER, menuitem_id INTEGER, quantity INTEGER, unit_price DECIMAL, price DECIMAL, UNIQUE (menuitem_id, user_id));
+CREATE INDEX cart_user ON cart (user_id);
+"""
+
+MENU_QUERY = (
+    "SELECT m.id, m.title, m.price, m.featured, c.id, c.slug, c.title "
+    "FROM menuitem m JOIN category c ON c.id = m.category_id ORDER BY m.price LIMIT 50"
+)
+
+CART_WRITE = (
+    "INSERT INTO cart (user_id, menuitem_id, quantity, unit_price, price) VALUES (?, ?, ?, 1, ?) "
+    "ON CONFLICT (menuitem_id, user_id) DO UPDATE SET quantity = excluded.quantity, price = excluded.price"
+)
+
+STOCK_PROFILE = {'pragmas': {}, 'transaction_mode': None}
+
+
+def tuned_profile():
+    options = settings.DATABASES['default'].get('OPTIONS', {})
+    return {'pragmas': options.get('pragmas', {}), 'transaction_mode': options.get('transaction_mode')}
+
+
+def connect(path, profile):
+    # Matches what Django does: autocommit with a 5 second busy timeout.
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for name, value in profile['pragmas'].items():
+        connection.execute(f'PRAGMA {name} = {value}')
+    return connection
+
+
+def seed(path, profile, menu_items):
+    connection = connect(path, profile)
+    connection.executescript(SCHEMA)
+    connection.executemany("INSERT INTO category VALUES (?, ?, ?)", [(i, f'c{i}', f'Category {i}') for i in range(1, 11)])
+    connection.executemany(
+        "INSERT INTO menuitem VALUES (?, ?, ?, ?, ?)",
+        [(i, f'Item {i}', round(1 + (i % 500) / 10, 2), i % 7 == 0, 1 + i % 10) for i in range(1, menu_items + 1)],
+    )
+    connection.close()
+
+
+def reader(path, profile, deadline, results):
+    connection = connect(path, profile)
+    done = errors = 0
+    while time.time() < deadline:
+        try:
+            connection.execute(MENU_QUERY).fetchall()
+            done += 1
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put(('read', done, errors))
+
+
+def writer(path, profile, deadline, menu_items, seed_value, results):
+    connection = connect(path, profile)
+    rng = random.Random(seed_value)
+    begin = f"BEGIN {profile['transaction_mode']}" if profile['transaction_mode'] else 'BEGIN'
+    done = errors = 0
+    while time.time() < deadline:
+        user_id = rng.randint(1, 1000)
+        menuitem_id = rng.randint(1, menu_items)
+        quantity = rng.randint(1, 5)
+        try:
+            connection.execute(begin)
+            connection.execute("SELECT quantity FROM cart WHERE user_id = ? AND menuitem_id = ?", (user_id, menuitem_id)).fetchall()
+            connection.execute(CART_WRITE, (user_id, menuitem_id, quantity, quantity))
+            connection.execute('COMMIT')
+            done += 1
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            errors += 1
+    results.put(('write', done, errors))
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent read/write throughput of the stock SQLite setup against the tuned engine profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--menu-items', type=int, default=5000)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def run_profile(self, name, profile, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            seed(path, profile, options['menu_items'])
+
+            results = multiprocessing.Queue()
+            deadline = time.time() + 0.5 + options['seconds']
+            workers = [
+                multiprocessing.Process(target=reader, args=(path, profile, deadline, results))
+                for _ in range(options['readers'])
+            ] + [
+                multiprocessing.Process(target=writer, args=(path, profile, deadline, options['menu_items'], n, results))
+                for n in range(options['writers'])
+            ]
+            for worker in workers:
+                worker.start()
+            totals = {'read': [0, 0], 'write': [0, 0]}
+            for _ in workers:
+                kind, done, errors = results.get()
+                totals[kind][0] += done
+                totals[kind][1] += errors
+            for worker in workers:
+                worker.join()
+
+        elapsed = options['seconds'] + 0.5
+        return {
+            'profile': name,
+            'reads_per_second': totals['read'][0] / elapsed,
+            'writes_per_second': totals['write'][0] / elapsed,
+            'read_errors': totals['read'][1],
+            'write_errors': totals['write'][1],
+        }
+
+    def handle(self, *args, **options):
+        rows = [
+            self.run_profile('stock', STOCK_PROFILE, options),
+            self.run_profile('tuned', tuned_profile(), options),
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+
+        self.stdout.write(f"{options['readers']} readers, {options['writers']} writers, {options['seconds']}s per profile")
+        self.stdout.write(f"{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'read err':>9} {'write err':>10}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['profile']:<8} {row['reads_per_second']:>10.0f} {row['writes_per_second']:>10.0f} "
+                f"{row['read_errors']:>9} {row['write_errors']:>10}"
+            )
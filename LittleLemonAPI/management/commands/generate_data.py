@@ -0,0 +1,54 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic synthetic categories, menu items, users, carts and orders for scaling tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--categories', type=int, default=0)
+        parser.add_argument('--menu-items', type=int, default=0)
+        parser.add_argument('--users', type=int, default=0)
+        parser.add_argument('--managers', type=float, default=0.001, help="Fraction of generated users put in the Manager group.")
+        parser.add_argument('--crew', type=float, default=0.01, help="Fraction of generated users put in the DeliveryCrew group.")
+        parser.add_argument('--carts', type=int, default=0, help="Number of cart rows, spread over users without a cart.")
+        parser.add_argument('--items-per-cart', type=int, default=3)
+        parser.add_argument('--orders', type=int, default=0)
+        parser.add_argument('--items-per-order', type=int, default=3, help="Average number of lines per order.")
+        parser.add_argument('--start-date', type=date.fromisoformat, default=date(2024, 1, 1))
+        parser.add_argument('--days', type=int, default=365, help="Spread order dates over this many days from --start-date.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT statement.")
+        parser.add_argument('--chunk-size', type=int, default=50000, help="Parent rows per transaction.")
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+            start_date=options['start_date'],
+            days=options['days'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+
+        started = time.perf_counter()
+        written = 0
+        if options['categories']:
+            written += generator.categories(options['categories'])
+        if options['menu_items']:
+            written += generator.menu_items(options['menu_items'])
+        if options['users']:
+            written += generator.users(options['users'], managers=options['managers'], crew=options['crew'])
+        if options['carts']:
+            written += generator.carts(options['carts'], items_per_cart=options['items_per_cart'])
+        if options['orders']:
+            written += generator.orders(options['orders'], items_per_order=options['items_per_order'])
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written:,} rows in {elapsed:.1f}s ({written / elapsed if elapsed else 0:,.0f} rows/s)."
+        ))
@@ -0,0 +1,140 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from LittleLemonAPI import benchmark, queryplan
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database, replay every API route and run EXPLAIN QUERY PLAN on the SQL each one "
+        "issues, flagging full scans and temporary B-tree sorts and suggesting indexes for them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--menu-items', type=int, default=1000)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', help="Only check endpoints whose name starts with this prefix.")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print the full plan of every flagged statement.")
+        parser.add_argument('--apply', action='store_true', help="Create the suggested indexes in the throwaway database and re-check the plans.")
+        parser.add_argument('--check', action='store_true', help="Exit with an error if any index is suggested.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("The index advisor reads SQLite query plans.")
+        scenarios = [
+            scenario for scenario in benchmark.SCENARIOS
+            if not options['endpoints'] or any(scenario.name.startswith(prefix) for prefix in options['endpoints'])
+        ]
+        if not scenarios:
+            raise CommandError("No endpoint matches --endpoint.")
+
+        volumes = {
+            'categories': options['categories'],
+            'menu_items': options['menu_items'],
+            'users': options['users'],
+            'carts': options['carts'],
+            'orders': options['orders'],
+            'items_per_order': options['items_per_order'],
+        }
+
+        with benchmark.environment():
+            context = benchmark.seed(volumes, seed=options['seed'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            statements = {
+                scenario.name: [
+                    sql for sql in benchmark.capture_queries(scenario, context)
+                    if sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))
+                ]
+                for scenario in scenarios
+            }
+
+            suggestions = self.report(statements, options['verbose_plans'])
+            if options['apply'] and suggestions:
+                self.apply(suggestions, statements)
+
+        if options['check'] and suggestions:
+            raise CommandError(f"{len(suggestions)} index(es) suggested.")
+
+    def inspect(self, statements):
+        """Return ``{scenario: [(sql, plan, problems)]}`` for the flagged statements."""
+        flagged = {}
+        for name, queries in statements.items():
+            for sql in dict.fromkeys(queries):
+                plan = queryplan.explain(connection, sql)
+                found = queryplan.problems(sql, plan)
+                if found:
+                    flagged.setdefault(name, []).append((sql, plan, found))
+        return flagged
+
+    def report(self, statements, verbose):
+        suggestions = defaultdict(set)
+        indexes = {}
+        for name, flagged in self.inspect(statements).items():
+            self.stdout.write(name)
+            for sql, plan, found in flagged:
+                self.stdout.write(f"  {sql if verbose else self.shorten(sql)}")
+                for line in plan if verbose else ():
+                    self.stdout.write(f"      | {line}")
+                for problem in found:
+                    suggestion = queryplan.suggest(sql, problem)
+                    bare = queryplan.bare_booleans(sql, problem)
+                    if bare:
+                        advice = (
+                            f"{', '.join(bare)} is tested as a bare boolean, which cannot use an index; "
+                            f"filter with __in=[value] instead"
+                        )
+                    elif queryplan.pk_lookup(sql, problem):
+                        advice = "rows are picked by primary key; sorting them needs no index"
+                    elif suggestion is None:
+                        advice = "no predicate on this table; full read by design"
+                    else:
+                        if suggestion.table not in indexes:
+                            indexes[suggestion.table] = queryplan.existing_indexes(connection, suggestion.table)
+                        if queryplan.covered(suggestion, indexes[suggestion.table]):
+                            advice = f"an index on ({', '.join(suggestion.columns)}) exists; the planner prefers the scan"
+                        else:
+                            suggestions[suggestion].add(name)
+                            advice = f"suggest index on ({', '.join(suggestion.columns)})"
+                    self.stdout.write(f"    {problem.detail}: {advice}")
+
+        if not suggestions:
+            self.stdout.write(self.style.SUCCESS("No missing indexes."))
+            return {}
+        self.stdout.write('')
+        self.stdout.write("Suggested indexes:")
+        for suggestion, names in sorted(suggestions.items()):
+            self.stdout.write(f"  {self.create_index(suggestion)};  -- {', '.join(sorted(names))}")
+        return suggestions
+
+    def apply(self, suggestions, statements):
+        before = self.inspect(statements)
+        with connection.cursor() as cursor:
+            for suggestion in suggestions:
+                cursor.execute(self.create_index(suggestion))
+            cursor.execute('ANALYZE')
+        after = self.inspect(statements)
+        self.stdout.write('')
+        self.stdout.write("Flagged plan steps with the suggested indexes:")
+        for name in statements:
+            old = sum(len(found) for _, _, found in before.get(name, ()))
+            new = sum(len(found) for _, _, found in after.get(name, ()))
+            if old or new:
+                self.stdout.write(f"  {name}: {old} -> {new}")
+
+    @staticmethod
+    def create_index(suggestion):
+        name = '_'.join((suggestion.table, *suggestion.columns, 'advisor'))
+        columns = ', '.join(f'"{column}"' for column in suggestion.columns)
+        return f'CREATE INDEX "{name}" ON "{suggestion.table}" ({columns})'
+
+    @staticmethod
+    def shorten(sql, width=160):
+        return sql if len(sql) <= width else sql[:width - 3] + '...'
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from LittleLemonAPI.models import Order
+
+
+class Command(BaseCommand):
+    help = "Check Order.total against the sum of its order items and optionally repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Rewrite drifted totals instead of only reporting them.")
+        parser.add_argument('--batch-size', type=int, default=10000, help="Number of order ids scanned per transaction.")
+        parser.add_argument('--show', type=int, default=20, help="Maximum number of drifted order ids to list.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Order.objects.aggregate(low=Min('id'), high=Max('id'))
+
+        if bounds['low'] is None:
+            self.stdout.write("No orders.")
+            return
+
+        drifted = 0
+        repaired = 0
+        sample = []
+
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            with transaction.atomic():
+                batch = Order.objects.filter(id__gte=start, id__lt=start + batch_size).with_drift()
+
+                if len(sample) < options['show']:
+                    sample += batch.values_list('id', flat=True)[:options['show'] - len(sample)]
+
+                if options['repair']:
+                    ids = list(batch.values_list('id', flat=True))
+                    drifted += len(ids)
+                    repaired += Order.objects.filter(id__in=ids).recompute_totals()
+                else:
+                    drifted += batch.count()
+
+        self.stdout.write(f"{drifted} order(s) with drifted totals.")
+        if sample:
+            self.stdout.write("e.g. " + ", ".join(str(id) for id in sample))
+        if options['repair']:
+            self.stdout.write(self.style.SUCCESS(f"{repaired} order total(s) repaired."))
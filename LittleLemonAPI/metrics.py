@@ -0,0 +1,348 @@
+"""
+Per-view request instrumentation exposed in the Prometheus text format.
+
+``MetricsMiddleware`` records, for every resolved view, the request count,
+a latency histogram, DB queries and DB time, serializer and render time
+and response size. Each worker process keeps its counters in memory and
+periodically writes a JSON snapshot to ``METRICS_DIR``; the metrics
+endpoint sums the snapshots of every process. Snapshots of processes that
+have exited are folded into ``retired.json``, so the directory stays small
+and the sums never go down.
+"""
+import fcntl
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import BasePermission
+from rest_framework.renderers import BaseRenderer
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+RETIRED = 'retired.json'
+
+COUNTERS = ('requests', 'queries', 'db_seconds', 'serializer_seconds', 'render_seconds', 'response_bytes', 'seconds')
+
+_current = ContextVar('request_metrics', default=None)
+_observers = ContextVar('query_observers', default=())
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'db_seconds', 'serializer_seconds', 'render_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.render_seconds = 0.0
+
+    def query(self, alias, sql, params, many, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.series = {}
+        self._flushed = 0.0
+
+    def observe(self, labels, seconds, record, size):
+        bucket = bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = dict.fromkeys(COUNTERS, 0)
+                series['buckets'] = [0] * (len(LATENCY_BUCKETS) + 1)
+            series['requests'] += 1
+            series['seconds'] += seconds
+            series['buckets'][bucket] += 1
+            series['queries'] += record.queries
+            series['db_seconds'] += record.db_seconds
+            series['serializer_seconds'] += record.serializer_seconds
+            series['render_seconds'] += record.render_seconds
+            series['response_bytes'] += size
+
+    def snapshot(self):
+        from .authentication import token_cache
+        from .cache import catalog_stats
+
+        with self._lock:
+            series = [
+                {'labels': list(labels), **dict(values, buckets=list(values['buckets']))}
+                for labels, values in self.series.items()
+            ]
+        return {
+            'pid': os.getpid(),
+            'series': series,
+            'catalog_cache': catalog_stats.as_dict(),
+            'token_cache': token_cache.as_dict(),
+        }
+
+    def flush(self, force=False):
+        """Write this process's snapshot, at most once per flush interval."""
+        now = time.monotonic()
+        if not force and now - self._flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed = now
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(directory / f'{os.getpid()}.json', self.snapshot())
+
+
+def _write(path, snapshot):
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as output:
+        json.dump(snapshot, output)
+    os.replace(temporary, path)
+
+
+registry = Registry()
+
+
+def _observe(execute, sql, params, many, context):
+    observers = _observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for observer in observers:
+            observer(context['connection'].alias, sql, params, many, elapsed)
+
+
+def install_observer(connection, **kwargs):
+    # Installed once per connection, in whichever thread it is used, so
+    # queries the async ORM runs in a worker thread are seen too. It goes
+    # first because execute_wrapper() blocks pop their wrapper off the end.
+    if _observe not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _observe)
+
+
+connection_created.connect(install_observer)
+
+
+@contextmanager
+def observing_queries(observer):
+    """Call ``observer(alias, sql, params, many, seconds)`` for queries run in this context."""
+    for connection in connections.all(initialized_only=True):
+        install_observer(connection)
+    token = _observers.set(_observers.get() + (observer,))
+    try:
+        yield
+    finally:
+        _observers.reset(token)
+
+
+def add_time(counter, seconds):
+    record = _current.get()
+    if record is not None:
+        setattr(record, counter, getattr(record, counter) + seconds)
+
+
+def view_name(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unresolved'
+    view = getattr(match.func, 'view_class', match.func)
+    return view.__name__
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with observing_queries(record.query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, record, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            with observing_queries(record.query):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, record, time.perf_counter() - started)
+
+    def observe(self, request, response, record, elapsed):
+        size = 0 if response.streaming else len(response.content)
+        labels = (view_name(request), request.method, f'{response.status_code // 100}xx')
+        registry.observe(labels, elapsed, record, size)
+        registry.flush()
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses render right after this hook returns.
+        record = _current.get()
+        started = time.perf_counter()
+
+        def rendered(response):
+            if record is not None:
+                record.render_seconds += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        # Errors (e.g. a failed permission check) come through as dicts.
+        return json.dumps(data).encode(self.charset)
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+
+
+def aggregate(snapshots):
+    series = {}
+    caches = {'catalog_cache': {}, 'token_cache': {}}
+    for snapshot in snapshots:
+        for entry in snapshot['series']:
+            labels = tuple(entry['labels'])
+            total = series.setdefault(labels, dict.fromkeys(COUNTERS, 0) | {'buckets': [0] * (len(LATENCY_BUCKETS) + 1)})
+            for counter in COUNTERS:
+                total[counter] += entry[counter]
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], entry['buckets'])]
+        for name, totals in caches.items():
+            for key, value in snapshot.get(name, {}).items():
+                if key in ('hits', 'misses', 'evictions', 'auth_count', 'auth_seconds'):
+                    totals[key] = totals.get(key, 0) + value
+    return series, caches
+
+
+def _read(path):
+    try:
+        with open(path) as snapshot:
+            return json.load(snapshot)
+    except (OSError, ValueError):
+        return None
+
+
+def _exited(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def retire_exited(directory):
+    """Fold the snapshots of exited worker processes into ``retired.json``."""
+    exited = [path for path in directory.glob('*.json') if path.stem.isdigit() and _exited(int(path.stem))]
+    if not exited:
+        return
+    with open(directory / 'retired.lock', 'w') as lock:
+        # Another scrape may be retiring the same files; whoever comes second
+        # finds them gone.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshots = [snapshot for snapshot in map(_read, [directory / RETIRED, *exited]) if snapshot is not None]
+        series, caches = aggregate(snapshots)
+        _write(directory / RETIRED, {
+            'pid': None,
+            'series': [{'labels': list(labels), **values} for labels, values in series.items()],
+            **caches,
+        })
+        for path in exited:
+            path.unlink(missing_ok=True)
+
+
+def collect():
+    registry.flush(force=True)
+    directory = Path(settings.METRICS_DIR)
+    retire_exited(directory)
+    return aggregate(snapshot for snapshot in map(_read, directory.glob('*.json')) if snapshot is not None)
+
+
+class IsMetricsScraper(BasePermission):
+    """
+    A scraper presenting ``Authorization: Bearer <METRICS_SCRAPE_TOKEN>`` or
+    connecting from an address in ``METRICS_ALLOWED_IPS``.
+    """
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_SCRAPE_TOKEN', None)
+        keyword, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if token and keyword.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode()):
+            return True
+        return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+
+
+def render_prometheus(series, caches):
+    names = ('view', 'method', 'status')
+    lines = []
+
+    def family(name, kind, text):
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    family('littlelemon_request_duration_seconds', 'histogram', 'Request latency by view.')
+    for labels, values in sorted(series.items()):
+        base = _labels(names, labels)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), values['buckets']):
+            cumulative += count
+            lines.append(f'littlelemon_request_duration_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+        lines.append(f'littlelemon_request_duration_seconds_sum{{{base}}} {values["seconds"]}')
+        lines.append(f'littlelemon_request_duration_seconds_count{{{base}}} {values["requests"]}')
+
+    for counter, text in (
+        ('requests', 'Requests by view.'),
+        ('queries', 'Database queries by view.'),
+        ('db_seconds', 'Time spent in database queries by view.'),
+        ('serializer_seconds', 'Time spent in serializers by view.'),
+        ('render_seconds', 'Time spent rendering responses by view.'),
+        ('response_bytes', 'Response body bytes by view.'),
+    ):
+        name = f'littlelemon_{counter}_total'
+        family(name, 'counter', text)
+        for labels, values in sorted(series.items()):
+            lines.append(f'{name}{{{_labels(names, labels)}}} {values[counter]}')
+
+    for cache_name, totals in caches.items():
+        for key, value in sorted(totals.items()):
+            name = f'littlelemon_{cache_name}_{key}_total'
+            family(name, 'counter', f'{cache_name.replace("_", " ").capitalize()} {key.replace("_", " ")}.')
+            lines.append(f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
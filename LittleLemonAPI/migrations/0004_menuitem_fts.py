@@ -0,0 +1,88 @@
+import django.db.models.deletion
+import LittleLemonAPI.models
+from django.db import migrations, models
+
+
+FORWARD = [
+    """
+    CREATE VIRTUAL TABLE "LittleLemonAPI_menuitem_fts" USING fts5(
+        title, category, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    # Title matches count twice as much as category matches in ``rank``.
+    """
+    INSERT INTO "LittleLemonAPI_menuitem_fts" ("LittleLemonAPI_menuitem_fts", rank) VALUES ('rank', 'bm25(2.0, 1.0)')
+    """,
+    """
+    INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+    SELECT m.id, m.title, c.title
+    FROM "LittleLemonAPI_menuitem" m JOIN "LittleLemonAPI_category" c ON c.id = m.category_id
+    """,
+    """
+    CREATE TRIGGER "LittleLemonAPI_menuitem_fts_insert" AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+        INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category)
+        VALUES (new.id, new.title, (SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER "LittleLemonAPI_menuitem_fts_update" AFTER UPDATE OF title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+        UPDATE "LittleLemonAPI_menuitem_fts"
+        SET title = new.title, category = (SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id)
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER "LittleLemonAPI_menuitem_fts_delete" AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+        DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER "LittleLemonAPI_category_fts_update" AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+        UPDATE "LittleLemonAPI_menuitem_fts" SET category = new.title
+        WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id);
+    END
+    """,
+]
+
+BACKWARD = [
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_category_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_delete"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_insert"',
+    'DROP TABLE IF EXISTS "LittleLemonAPI_menuitem_fts"',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # FTS5 is SQLite-only; other databases keep the icontains fallback.
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0003_order_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(FORWARD), run(BACKWARD)),
+        migrations.CreateModel(
+            name='MenuItemSearch',
+            fields=[
+                ('menuitem', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search', serialize=False, to='LittleLemonAPI.menuitem')),
+                ('title', models.TextField()),
+                ('category', models.TextField()),
+                ('document', LittleLemonAPI.models.SearchDocumentField(db_column='LittleLemonAPI_menuitem_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'LittleLemonAPI_menuitem_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now, Round
 from django.contrib.auth.models import User, Group
 
 class Category(models.Model):
@@ -17,6 +20,34 @@ class MenuItem(models.Model):
     def __str__(self) -> str:
         return self.title
 
+class SearchDocumentField(models.TextField):
+    pass
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class MenuItemSearch(models.Model):
+    # Read-only view of the FTS5 index maintained by triggers (migration
+    # 0004). ``document`` is the table's hidden column: matching against it
+    # searches every column, and ``rank`` is the bm25 score of that match.
+    menuitem = models.OneToOneField(MenuItem, primary_key=True, db_column='rowid', related_name='search', on_delete=models.DO_NOTHING)
+    title = models.TextField()
+    category = models.TextField()
+    document = SearchDocumentField(db_column='LittleLemonAPI_menuitem_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'LittleLemonAPI_menuitem_fts'
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
@@ -27,12 +58,61 @@ class Cart(models.Model):
     class Meta:
         unique_together = ('menuitem', 'user')
 
+class OrderQuerySet(models.QuerySet):
+
+    def with_items(self):
+        # Fetch plan for OrdersSerializer: two queries per page however many
+        # orders it holds. Users are rendered as primary keys, so they are
+        # read from the *_id columns rather than joined.
+        return self.only('id', 'user', 'delivery_crew', 'status', 'total', 'date', 'updated').prefetch_related(items_prefetch())
+
+    def items_total(self):
+        totals = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(total=Round(Sum('price'), 2))
+            .values('total')
+        )
+        # SQLite sums decimals as floats (0.10 + 0.20 is 0.30000000000000004);
+        # rounding in SQL stores the same value as a saved Decimal('0.30'),
+        # so totals compare equal in filters and keyset cursors.
+        return Coalesce(Subquery(totals), Value(Decimal('0')), output_field=models.DecimalField(max_digits=6, decimal_places=2))
+
+    def with_drift(self):
+        return self.alias(items_total=self.items_total()).exclude(total=F('items_total'))
+
+    def recompute_totals(self):
+        # A single UPDATE ... SET total = (SELECT SUM(price) ...) keeps the
+        # total consistent with concurrent item edits without reading any rows.
+        # Totals only change with the items, so this also marks the order as
+        # modified for conditional GETs.
+        return self.update(total=self.items_total(), updated=Now())
+
+    def touch(self):
+        return self.update(updated=Now())
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True)
     status = models.BooleanField(db_index=True, default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
     date = models.DateField(db_index=True)
+    # Bumped on every change to the order or its items; the ETag of
+    # GET /api/orders/<id> is derived from it.
+    updated = models.DateTimeField(auto_now=True, db_default=Now())
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        # Listings filtered by owner, crew or status and sorted by date
+        # (see the index_advisor command).
+        indexes = [
+            models.Index(fields=['user', 'date'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'status', 'date'], name='order_crew_status_date_idx'),
+            models.Index(fields=['status', 'date'], name='order_status_date_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -46,3 +126,7 @@ class OrderItem(models.Model):
         unique_together = ('order', 'menuitem')
 
 
+def items_prefetch():
+    return Prefetch('order_items', queryset=OrderItem.objects.only('id', 'order', 'menuitem', 'quantity', 'unit_price', 'price'))
+
+
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldError, FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.utils.urls import replace_query_param
+
+
+CURSOR_PARAM = 'cursor'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+
+class KeysetPaginator:
+    """
+    Pages a queryset by the values of its ordering fields plus ``pk``, so
+    every page is a ``WHERE (ordering) > (cursor) LIMIT n`` lookup with no
+    ``COUNT(*)`` and no ``OFFSET``. NULLs sort before any value.
+
+    ``id`` (or ``pk``) ends the ordering in the direction it is given;
+    fields after it could never break a tie. Without it, ascending ``id``
+    is appended.
+    """
+    page_size = 20
+
+    def __init__(self, queryset, ordering=None, per_page=None):
+        self.queryset = queryset
+        self.per_page = per_page or self.page_size
+        if self.per_page < 1:
+            raise InvalidCursor('per_page must be positive')
+
+        self.ordering = []
+        for field in ordering or []:
+            if field.lstrip('-') in ('pk', 'id'):
+                self.ordering.append(field.replace('pk', 'id'))
+                break
+            self.ordering.append(field)
+        else:
+            self.ordering.append('id')
+        self.fields = [self._resolve(field.lstrip('-')) for field in self.ordering]
+
+    def _resolve(self, path):
+        opts = self.queryset.model._meta
+        nullable = False
+        field = None
+        for part in path.split('__'):
+            if opts is None:
+                raise FieldError(f"Cannot order by '{path}'")
+            try:
+                field = opts.get_field(part)
+            except FieldDoesNotExist:
+                raise FieldError(f"Cannot resolve keyword '{part}' into field")
+            if not field.concrete or field.many_to_many or field.one_to_many:
+                raise FieldError(f"Cannot order by '{path}'")
+            nullable = nullable or field.null
+            opts = field.related_model._meta if field.is_relation else None
+        return path, field, nullable
+
+    def _order_by(self, reverse):
+        expressions = []
+        for name in self.ordering:
+            descending = name.startswith('-') != reverse
+            expression = F(name.lstrip('-'))
+            expressions.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_first=True))
+        return expressions
+
+    def _after(self, values, reverse):
+        condition = Q(pk__in=[])
+        equal = Q()
+        for name, (path, field, nullable), value in zip(self.ordering, self.fields, values):
+            descending = name.startswith('-') != reverse
+            if value is None:
+                step = Q(**{f'{path}__isnull': False}) if not descending else Q(pk__in=[])
+                same = Q(**{f'{path}__isnull': True})
+            else:
+                step = Q(**{f'{path}__lt' if descending else f'{path}__gt': value})
+                if descending and nullable:
+                    step |= Q(**{f'{path}__isnull': True})
+                same = Q(**{path: value})
+            condition |= equal & step
+            equal &= same
+        return condition
+
+    def _position(self, obj):
+        if isinstance(obj, dict):
+            # Rows from values(); ordering paths must be among the columns.
+            return [obj[path] for path, field, nullable in self.fields]
+        values = []
+        for path, field, nullable in self.fields:
+            value = obj
+            for part in path.split('__')[:-1]:
+                value = getattr(value, part) if value is not None else None
+            values.append(getattr(value, field.attname) if value is not None else None)
+        return values
+
+    def encode(self, obj, reverse=False):
+        payload = {'o': self.ordering, 'v': self._position(obj), 'r': reverse}
+        raw = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            payload = json.loads(raw)
+            if payload['o'] != self.ordering or len(payload['v']) != len(self.fields):
+                raise InvalidCursor('Cursor does not match ordering')
+            values = [
+                None if value is None else field.target_field.to_python(value) if field.is_relation else field.to_python(value)
+                for (path, field, nullable), value in zip(self.fields, payload['v'])
+            ]
+            return values, bool(payload['r'])
+        except InvalidCursor:
+            raise
+        except (binascii.Error, ValueError, TypeError, KeyError, ValidationError) as error:
+            raise InvalidCursor('Invalid cursor') from error
+
+    def _query(self, cursor):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            values, reverse = self.decode(cursor)
+            queryset = queryset.filter(self._after(values, reverse))
+        return queryset.order_by(*self._order_by(reverse))[:self.per_page + 1], reverse
+
+    def _page(self, rows, cursor, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            next_cursor = self.encode(rows[-1]) if rows else None
+            previous_cursor = self.encode(rows[0], reverse=True) if rows and has_more else None
+        else:
+            next_cursor = self.encode(rows[-1]) if rows and has_more else None
+            previous_cursor = self.encode(rows[0], reverse=True) if rows and cursor else None
+
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        queryset, reverse = self._query(cursor)
+        return self._page(list(queryset), cursor, reverse)
+
+    async def apage(self, cursor=None):
+        queryset, reverse = self._query(cursor)
+        return self._page([row async for row in queryset], cursor, reverse)
+
+
+async def apaginate(queryset, page, per_page):
+    """
+    The rows of page ``page`` as Paginator.page() would return them, or []
+    where it raises EmptyPage. Without ``per_page`` everything is page 1.
+    """
+    if per_page is None:
+        return [row async for row in queryset] if page == 1 else []
+    if page > 1 and (page - 1) * per_page >= await queryset.acount():
+        return []
+    return [row async for row in queryset[(page - 1) * per_page:page * per_page]]
+
+
+def get_cursor(request):
+    return request.query_params.get(CURSOR_PARAM)
+
+
+def cursor_link(request, cursor):
+    if cursor is None:
+        return None
+    return replace_query_param(request.build_absolute_uri(), CURSOR_PARAM, cursor)
+
+
+def cursor_response_data(request, results, next_cursor, previous_cursor):
+    return {
+        'next': cursor_link(request, next_cursor),
+        'previous': cursor_link(request, previous_cursor),
+        'results': results,
+    }
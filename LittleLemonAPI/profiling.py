@@ -0,0 +1,285 @@
+"""
+On-demand profiling of live requests.
+
+A staff user can ask for a profile of one request by sending the
+``X-Profile`` header (``cprofile``, the default, or ``stack``), and
+``PROFILE_SAMPLE_RATE`` profiles 1 in N requests on its own. Each capture
+stores a pstats (``.prof``) or collapsed-stack (``.collapsed``) file and a
+``.json`` file with the request summary and its SQL log in ``PROFILE_DIR``.
+
+A process runs one cProfile capture at a time: on Python 3.12 cProfile
+records every thread and refuses a second profiler, and before 3.12 two
+captures on the event loop thread would replace each other. A request
+asking for a capture while another is running is served unprofiled.
+"""
+import cProfile
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedTokenAuthentication
+from .metrics import observing_queries, view_name
+
+
+HEADER = 'HTTP_X_PROFILE'
+
+MODES = {'cprofile': '.prof', 'stack': '.collapsed'}
+
+CAPTURE_NAME = re.compile(r'^[\w-]+\.(json|prof|collapsed)$')
+
+_sequence = itertools.count()
+
+_cprofile_busy = threading.Lock()
+
+
+class StackSampler:
+    """
+    Samples the Python stack of every thread but its own every ``interval``
+    seconds. An async request runs its ORM queries in worker threads, so
+    sampling only the thread that started the capture would miss them.
+    Each stack is rooted at its thread's name; other requests served at
+    the same time show up under their own threads.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, f'Thread-{ident}'))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        authenticated = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+async def ais_staff(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return user.is_staff
+    try:
+        authenticated = await CachedTokenAuthentication().aauthenticate(request)
+    except AuthenticationFailed:
+        return False
+    return authenticated is not None and authenticated[0].is_staff
+
+
+def header_mode(request):
+    mode = request.META.get(HEADER)
+    if mode is None:
+        return None
+    mode = mode.strip().lower() or 'cprofile'
+    return mode if mode in MODES else None
+
+
+def sampled():
+    rate = settings.PROFILE_SAMPLE_RATE
+    if rate and random.random() * rate < 1:
+        return 'cprofile', 'sample'
+    return None
+
+
+def requested_mode(request):
+    """Return ``(mode, trigger)`` for a request to profile, or None."""
+    mode = header_mode(request)
+    if mode is not None and is_staff(request):
+        return mode, 'header'
+    return sampled()
+
+
+async def arequested_mode(request):
+    mode = header_mode(request)
+    if mode is not None and await ais_staff(request):
+        return mode, 'header'
+    return sampled()
+
+
+def prune(keep):
+    captures = sorted(profile_dir().glob('*.json'), key=lambda path: path.name)
+    for stale in captures[:max(0, len(captures) - keep)]:
+        for suffix in ('.json', *MODES.values()):
+            stale.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def list_captures():
+    captures = []
+    for path in sorted(profile_dir().glob('*.json'), key=lambda path: path.name, reverse=True):
+        try:
+            with open(path) as summary:
+                capture = json.load(summary)
+        except (OSError, ValueError):
+            continue
+        capture.pop('sql', None)
+        captures.append(capture)
+    return captures
+
+
+def capture_path(name):
+    """Return the path of a stored capture file, or None for unknown names."""
+    if not CAPTURE_NAME.match(name):
+        return None
+    path = profile_dir() / name
+    return path if path.is_file() else None
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        requested = requested_mode(request)
+        if requested is None:
+            return self.get_response(request)
+        capture = Capture(*requested)
+        if not capture.start():
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            capture.stop()
+        return capture.save(request, response)
+
+    async def __acall__(self, request):
+        requested = await arequested_mode(request)
+        if requested is None:
+            return await self.get_response(request)
+        # The profiler follows the event loop thread, so other requests
+        # served concurrently show up in the profile too.
+        capture = Capture(*requested)
+        if not capture.start():
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            capture.stop()
+        return capture.save(request, response)
+
+
+class Capture:
+    """One profiled request: the profiler, its SQL log and its timing."""
+
+    def __init__(self, mode, trigger):
+        self.mode = mode
+        self.trigger = trigger
+        if mode == 'stack':
+            self.profiler = StackSampler(settings.PROFILE_STACK_INTERVAL)
+        else:
+            self.profiler = cProfile.Profile()
+        self.queries = []
+        self._observing = observing_queries(self.log_query)
+
+    def log_query(self, alias, sql, params, many, seconds):
+        # Parameters are left out: they carry token keys and other secrets.
+        self.queries.append({
+            'alias': alias,
+            'sql': sql,
+            'many': many,
+            'ms': seconds * 1000,
+        })
+
+    def start(self):
+        """Start profiling; False when another cProfile capture is running."""
+        # Never blocks: on the event loop, waiting would stall the request
+        # holding the profiler too.
+        if self.mode == 'cprofile' and not _cprofile_busy.acquire(blocking=False):
+            return False
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Another profiling tool is active (Python 3.12+).
+            self._release()
+            return False
+        self._observing.__enter__()
+        self.started = time.perf_counter()
+        return True
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+        self._observing.__exit__(None, None, None)
+        self.profiler.disable()
+        self._release()
+
+    def _release(self):
+        if self.mode == 'cprofile':
+            _cprofile_busy.release()
+
+    def save(self, request, response):
+        mode = self.mode
+        queries = self.queries
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(_sequence):06d}"
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(directory / f'{name}{MODES[mode]}')
+        with open(directory / f'{name}.json', 'w') as summary:
+            json.dump({
+                'id': name,
+                'mode': mode,
+                'profile': f'{name}{MODES[mode]}',
+                'trigger': self.trigger,
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': view_name(request),
+                'status': response.status_code,
+                'ms': self.elapsed * 1000,
+                'query_count': len(queries),
+                'query_ms': sum(query['ms'] for query in queries),
+                'sql': queries,
+            }, summary)
+        prune(settings.PROFILE_MAX_CAPTURES)
+
+        response['X-Profile-Id'] = name
+        return response
@@ -0,0 +1,162 @@
+"""
+Query plan inspection for the SQL the views issue.
+
+``explain`` runs ``EXPLAIN QUERY PLAN`` (SQLite) on a captured statement
+and ``problems`` picks out the steps worth an index: full table scans and
+temporary B-trees built for ORDER BY, GROUP BY or DISTINCT. ``suggest``
+derives an index from the statement's own predicates on the scanned
+table: equality columns first, then the ordering columns or one range
+column, in the order the statement mentions them. The primary key is
+never suggested: it is the rowid, which the table's own B-tree is keyed
+by, and a statement selecting rows by it needs no other index.
+"""
+import re
+from collections import namedtuple
+
+
+Problem = namedtuple('Problem', 'kind table alias detail')
+Suggestion = namedtuple('Suggestion', 'table columns')
+
+SCAN = re.compile(r'^SCAN (?P<name>\S+)(?P<rest>.*)$')
+TEMP_BTREE = re.compile(r'^USE TEMP B-TREE FOR (?P<what>.+)$')
+SEARCH = re.compile(r'^SEARCH (?P<name>\S+)')
+TABLE_REF = re.compile(r'(?:FROM|JOIN|UPDATE)\s+"(?P<table>[^"]+)"(?:\s+(?:AS\s+)?(?P<alias>(?!ON\b|WHERE\b|INNER\b|LEFT\b|SET\b)\w+))?')
+CLAUSE = re.compile(r'\b(WHERE|ORDER BY|GROUP BY|LIMIT|SET)\b')
+
+# The primary key column of every table here; SQLite stores it as the rowid.
+ROWID = 'id'
+
+EQUALITY = ('=', 'IN', 'IS')
+RANGE = ('>', '>=', '<', '<=', 'BETWEEN')
+
+
+def explain(connection, sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[3] for row in cursor.fetchall()]
+
+
+def aliases(sql):
+    """Map each table alias (or bare table name) in ``sql`` to its table."""
+    found = {}
+    for match in TABLE_REF.finditer(sql):
+        found[match['alias'] or match['table']] = match['table']
+        found.setdefault(match['table'], match['table'])
+    return found
+
+
+def problems(sql, plan):
+    tables = aliases(sql)
+    found = []
+    last = None
+    for detail in plan:
+        scan = SCAN.match(detail) or SEARCH.match(detail)
+        if scan:
+            last = scan['name']
+        if SCAN.match(detail) and 'VIRTUAL TABLE' not in detail and scan['name'] in tables:
+            # A scan of the full index is still a scan, just an ordered one.
+            found.append(Problem('scan', tables[scan['name']], scan['name'], detail))
+        elif TEMP_BTREE.match(detail):
+            table = tables.get(last)
+            found.append(Problem('temp-btree', table, last, detail))
+    return found
+
+
+def _clauses(sql):
+    """Split the outermost statement into {'WHERE': ..., 'ORDER BY': ...}."""
+    parts = {}
+    depth = 0
+    start = None
+    name = None
+    for position, character in enumerate(sql):
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth -= 1
+        elif depth == 0:
+            match = CLAUSE.match(sql, position)
+            if match and (position == 0 or not sql[position - 1].isalnum()):
+                if name is not None:
+                    parts[name] = sql[start:position]
+                name, start = match[1], match.end()
+    if name is not None:
+        parts[name] = sql[start:]
+    return parts
+
+
+def _reference(alias):
+    return rf'(?:"{re.escape(alias)}"|\b{re.escape(alias)})\."(\w+)"'
+
+
+def _columns(text, alias, operators):
+    operators = '|'.join(map(re.escape, sorted(operators, key=len, reverse=True)))
+    # Django writes ``boolean_field=True`` as the bare column (and False
+    # as ``NOT column``).
+    pattern = re.compile(rf'{_reference(alias)}\s*(?:(NOT\s+)?(?:{operators})\s|(?=\s+AND\b|\s*\)|\s*$))')
+    columns = []
+    for column, negated in pattern.findall(text):
+        if not negated and column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _ordering(text, alias):
+    columns = []
+    for column in re.findall(_reference(alias), text):
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def bare_booleans(sql, problem):
+    """Columns of the scanned table tested as a bare (or negated) boolean."""
+    if problem.alias is None:
+        return []
+    where = _clauses(sql).get('WHERE', '')
+    pattern = re.compile(rf'(?:^|\(|\bAND|\bOR|\bNOT)\s*{_reference(problem.alias)}(?=\s+AND\b|\s+OR\b|\s*\)|\s*$)')
+    return list(dict.fromkeys(pattern.findall(where)))
+
+
+def pk_lookup(sql, problem):
+    """Whether ``sql`` picks the rows of the flagged table by primary key."""
+    if problem.alias is None:
+        return False
+    return ROWID in _columns(_clauses(sql).get('WHERE', ''), problem.alias, EQUALITY)
+
+
+def suggest(sql, problem):
+    """
+    An index for ``problem`` derived from ``sql``, or None without
+    predicates or when rows are picked by primary key.
+    """
+    if problem.table is None or pk_lookup(sql, problem):
+        return None
+    clauses = _clauses(sql)
+    where = clauses.get('WHERE', '')
+    equal = [column for column in _columns(where, problem.alias, EQUALITY) if column != ROWID]
+    ranged = [column for column in _columns(where, problem.alias, RANGE) if column not in equal and column != ROWID]
+    ordered = [column for column in _ordering(clauses.get('ORDER BY', ''), problem.alias) if column not in equal]
+    if problem.kind == 'temp-btree' and ordered:
+        columns = equal + ordered
+    else:
+        columns = equal + (ranged[:1] or ordered)
+    return Suggestion(problem.table, tuple(columns)) if columns else None
+
+
+def existing_indexes(connection, table):
+    """
+    Column tuples of the indexes on ``table``, including the primary key.
+    SQLite appends the rowid to every index key.
+    """
+    with connection.cursor() as cursor:
+        found = [(ROWID,)]
+        cursor.execute(f'PRAGMA index_list("{table}")')
+        for index in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f'PRAGMA index_info("{index}")')
+            found.append(tuple(row[2] for row in cursor.fetchall()) + (ROWID,))
+        return found
+
+
+def covered(suggestion, indexes):
+    """Whether an index already starts with the suggested columns."""
+    return any(index[:len(suggestion.columns)] == suggestion.columns for index in indexes)
@@ -0,0 +1,80 @@
+import itertools
+from django.contrib.auth.models import Group
+
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'DeliveryCrew'
+
+_group_ids = {}
+_membership_generation = itertools.count()
+_generation = next(_membership_generation)
+
+
+def group_id(name):
+    # Group ids never change for a given name, so they are memoized for the
+    # life of the process and only dropped when a Group is saved or deleted.
+    try:
+        return _group_ids[name]
+    except KeyError:
+        pk = Group.objects.filter(name=name).values_list('id', flat=True).first()
+        if pk is not None:
+            _group_ids[name] = pk
+        return pk
+
+
+def forget_group_ids():
+    _group_ids.clear()
+
+
+def membership_changed():
+    global _generation
+    _generation = next(_membership_generation)
+
+
+def _memoized(request):
+    memo = getattr(request, '_roles', None)
+    if memo is not None and memo[0] == request.user.pk and memo[1] == _generation:
+        return memo[2]
+    return None
+
+
+def _remember(request, names):
+    request._roles = (request.user.pk, _generation, names)
+    return names
+
+
+def _group_names(user):
+    if not user.is_authenticated:
+        return Group.objects.none().values_list('name', flat=True)
+    return user.groups.values_list('name', flat=True)
+
+
+def roles(request):
+    # Group names of the requesting user, loaded once per request and
+    # reloaded if any membership changes while the request is running.
+    request = getattr(request, '_request', request)
+    names = _memoized(request)
+    if names is None:
+        names = _remember(request, frozenset(_group_names(request.user)))
+    return names
+
+
+async def aroles(request):
+    """``roles`` for async views; the names are memoized the same way."""
+    request = getattr(request, '_request', request)
+    names = _memoized(request)
+    if names is None:
+        names = _remember(request, frozenset([name async for name in _group_names(request.user)]))
+    return names
+
+
+def is_manager(request):
+    return MANAGER in roles(request)
+
+
+def is_delivery_crew(request):
+    return DELIVERY_CREW in roles(request)
+
+
+def is_manager_or_admin(request):
+    return request.user.is_staff or is_manager(request)
@@ -0,0 +1,44 @@
+"""
+Full-text search over menu item and category titles.
+
+On SQLite the ``LittleLemonAPI_menuitem_fts`` FTS5 table (migration 0004)
+holds one row per menu item, keyed by its id, with the item and category
+titles. Triggers keep it in sync with both tables and ``MenuItemSearch``
+maps it for queries. Other databases fall back to ``icontains`` lookups.
+"""
+import re
+
+from django.db import connections
+
+from .models import MenuItemSearch
+
+
+TOKEN = re.compile(r'\w+')
+
+
+def terms(text):
+    """Lower-cased search terms of ``text``, or None when it has none."""
+    found = tuple(token.lower() for token in TOKEN.findall(str(text)))
+    return found or None
+
+
+def match_expression(terms, column=None):
+    # Every term must match as a prefix; terms are \w+ so quoting is safe.
+    query = ' '.join(f'"{term}"*' for term in terms)
+    return f'{column} : ({query})' if column else query
+
+
+def supported(queryset):
+    return connections[queryset.db].vendor == 'sqlite'
+
+
+def matching(queryset, terms, column=None):
+    # A subquery rather than a join, so it combines with ranked() (FTS5
+    # allows one MATCH per table reference).
+    ids = MenuItemSearch.objects.filter(document__match=match_expression(terms, column)).values('menuitem')
+    return queryset.filter(id__in=ids)
+
+
+def ranked(queryset, terms):
+    """Join the index, keep the matches and order them best first."""
+    return queryset.filter(search__document__match=match_expression(terms)).order_by('search__rank', 'id')
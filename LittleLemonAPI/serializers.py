@@ -2,15 +2,30 @@ from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
 from .models import MenuItem, Category, Cart, Order, OrderItem
 from django.contrib.auth.models import User, Group
+from .metrics import add_time
 import bleach
-
-class CategorySerializer(serializers.ModelSerializer):
+import time
+
+class TimedSerializerMixin:
+    # Only the outermost serializer (or each item of a top-level list) is
+    # timed so nested serializers are not counted twice.
+    def to_representation(self, instance):
+        parent = self.parent
+        if parent is not None and not (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return super().to_representation(instance)
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            add_time('serializer_seconds', time.perf_counter() - started)
+
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Category
         fields = ['id','slug', 'title']
 
-class MenuItemsSerializer(serializers.ModelSerializer):
+class MenuItemsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     
     category = CategorySerializer(Category, read_only=True)
     category_id = serializers.IntegerField(write_only=True)
@@ -33,7 +48,7 @@ class MenuItemsSerializer(serializers.ModelSerializer):
             'price': {'min_value': 0}
         }
 
-class CartItemsSerializer(serializers.ModelSerializer):
+class CartItemsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
    
     class Meta:
         model = Cart
@@ -51,7 +66,7 @@ class CartItemsSerializer(serializers.ModelSerializer):
         }
 
 
-class OrderItemsSerializer(serializers.ModelSerializer):
+class OrderItemsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'order', 'menuitem', 'quantity', 'unit_price', 'price']
@@ -68,7 +83,7 @@ class OrderItemsSerializer(serializers.ModelSerializer):
         }
 
 
-class OrdersSerializer(serializers.ModelSerializer):
+class OrdersSerializer(TimedSerializerMixin, serializers.ModelSerializer):
   
     order_items = OrderItemsSerializer(many=True, read_only=True)
 
@@ -90,14 +105,14 @@ class OrdersSerializer(serializers.ModelSerializer):
         ]
         
 
-class SingleMenuItemSerializer(serializers.ModelSerializer):
+class SingleMenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     
     class Meta:
         model = MenuItem
         fields = ['id', 'title', 'price', 'featured', 'category']
 
 
-class OrderMenuItemSerializer(serializers.ModelSerializer):
+class OrderMenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     
     menuitem = SingleMenuItemSerializer(read_only=True)
     
@@ -107,7 +122,7 @@ class OrderMenuItemSerializer(serializers.ModelSerializer):
 
 
 
-class GroupsSerializer(serializers.ModelSerializer):
+class GroupsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
 
     class Meta:
         model = User
@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+class SQLiteCounterStore:
+    """
+    Named counters kept in a small WAL-mode SQLite file, so every worker
+    process on the host sees the same value. A process compares a counter
+    with the one it last read to learn that something it holds locally
+    was changed by another process.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS shared_counter ('
+                'name TEXT PRIMARY KEY, value INTEGER NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, name, initial):
+        """The value of ``name``, created as ``initial`` if it does not exist yet."""
+        connection = self._connection()
+        row = connection.execute('SELECT value FROM shared_counter WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            connection.execute('INSERT OR IGNORE INTO shared_counter (name, value) VALUES (?, ?)', (name, initial))
+            row = connection.execute('SELECT value FROM shared_counter WHERE name = ?', (name,)).fetchone()
+        return row[0]
+
+    def incr(self, name, initial):
+        """Add one to ``name`` (``initial`` if it does not exist yet) and return it."""
+        return self._connection().execute(
+            'INSERT INTO shared_counter (name, value) VALUES (:name, :initial) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + 1 '
+            'RETURNING value',
+            {'name': name, 'initial': initial},
+        ).fetchone()[0]
+
+    def clear(self):
+        self._connection().execute('DELETE FROM shared_counter')
+
+
+counters = SQLiteCounterStore(getattr(settings, 'SHARED_STATE_DB', settings.BASE_DIR / 'shared.sqlite3'))
+
+
+def offload(function):
+    """
+    ``function`` as a coroutine function for async views, run in a worker
+    thread so reads and writes of the shared SQLite files never block the
+    event loop. The stores keep a connection per thread, so any thread will do.
+    """
+    return sync_to_async(function, thread_sensitive=False)
@@ -0,0 +1,67 @@
+from functools import partial
+
+from django.db import transaction
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_init, pre_delete, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import MenuItem, Category, Order
+from rest_framework.authtoken.models import Token
+from .cache import bump_catalog_version
+from .authentication import token_cache
+from . import roles
+
+
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    # Bumping before commit would let a concurrent reader cache the old rows
+    # under the new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_delete, sender=MenuItem)
+def touch_orders_of_menu_item(sender, instance, **kwargs):
+    # Deleting a menu item cascades to order items, which changes those
+    # orders without going through recompute_totals().
+    Order.objects.filter(order_items__menuitem=instance).touch()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_ids(sender, **kwargs):
+    roles.forget_group_ids()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_roles(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        roles.membership_changed()
+
+
+@receiver(post_delete, sender=Token)
+def evict_token(sender, instance, **kwargs):
+    token_cache.evict_key(instance.key)
+    # Other workers are told once the delete is visible to them, so they
+    # cannot re-cache the token from a read made before the commit.
+    transaction.on_commit(partial(token_cache.revoked, instance.user_id))
+
+
+# The fields a cached token's user is checked against when it is looked up.
+TOKEN_USER_FIELDS = ('password', 'is_active')
+
+
+@receiver(post_init, sender=User)
+def remember_token_user_fields(sender, instance, **kwargs):
+    # Deferred fields stay unread rather than costing a query.
+    instance._token_user_fields = tuple(instance.__dict__.get(field) for field in TOKEN_USER_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def evict_user_tokens(sender, instance, created, **kwargs):
+    fields = tuple(instance.__dict__.get(field) for field in TOKEN_USER_FIELDS)
+    if not created and fields != instance._token_user_fields:
+        token_cache.evict_user(instance.pk)
+        transaction.on_commit(partial(token_cache.revoked, instance.pk))
+    instance._token_user_fields = fields
@@ -1,3 +1,1375 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from urllib.parse import urlencode
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core.exceptions import SynchronousOnlyOperation
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from LittleLemon.db import routers
+from LittleLemon.db.routers import ReplicaPinningMiddleware, ReplicaRouter
+from LittleLemon.db.sqlite3.base import DatabaseWrapper
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import benchmark, events, export, metrics, profiling, queryplan, roles, rows
+from .authentication import CachedTokenAuthentication, TokenCache, token_cache
+from .datagen import DataGenerator
+from .models import Category, MenuItem, Cart, Order, OrderItem
+from .pagination import KeysetPaginator, apaginate, get_cursor
+from .serializers import OrdersSerializer
+from .shared import SQLiteCounterStore
+from .throttling import SQLiteBucketStore, TokenBucketThrottle
+
+
+class APITestCase(TestCase):
+    """
+    Runs without throttling, with the shared counters and metrics
+    snapshots in a scratch directory, and with an empty cache for every
+    test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        scratch = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(scratch.cleanup)
+        cls.scratch = Path(scratch.name)
+        counters = SQLiteCounterStore(cls.scratch / 'shared.sqlite3')
+        for patcher in (
+            mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {scope: '1000000/s' for scope in TokenBucketThrottle.THROTTLE_RATES}),
+            mock.patch.object(TokenBucketThrottle, 'store', SQLiteBucketStore(cls.scratch / 'throttle.sqlite3')),
+            mock.patch('LittleLemonAPI.cache.counters', counters),
+            mock.patch.object(token_cache, 'counters', counters),
+        ):
+            patcher.start()
+            cls.addClassCleanup(patcher.stop)
+        cls.enterClassContext(override_settings(METRICS_DIR=cls.scratch / 'metrics'))
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.managers = Group.objects.create(name=roles.MANAGER)
+        self.crew_group = Group.objects.create(name=roles.DELIVERY_CREW)
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.manager = User.objects.create_user('manager')
+        self.manager.groups.add(self.managers)
+        self.crew = User.objects.create_user('crew')
+        self.crew.groups.add(self.crew_group)
+        self.customer = User.objects.create_user('customer')
+        self.category = Category.objects.create(slug='mains', title='Mains')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def menu_item(self, price, title=None):
+        return MenuItem.objects.create(
+            title=title or f'Item {MenuItem.objects.count()}', price=Decimal(price), featured=False, category=self.category,
+        )
+
+    def order(self, user=None, items=(), **fields):
+        """An order holding one line per ``(menu_item, quantity)``, its total summed in SQL."""
+        order = Order.objects.create(user=user or self.customer, total=0, date=fields.pop('date', date(2024, 1, 1)), **fields)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity)
+            for item, quantity in items
+        )
+        Order.objects.filter(id=order.id).recompute_totals()
+        order.refresh_from_db()
+        return order
+
+    def walk(self, client, path, params):
+        """
+        Follow ``next`` from the first cursor page of ``path`` with ``params``,
+        then ``previous`` back; returns both as lists of pages of ids.
+        """
+        forward, url = [], f"{path}?{urlencode({'cursor': '', **params})}"
+        while url:
+            data = client.get(url).json()
+            forward.append([row['id'] for row in data['results']])
+            url, last = data['next'], data
+        backward, url = [], last['previous']
+        while url:
+            data = client.get(url).json()
+            backward.insert(0, [row['id'] for row in data['results']])
+            url = data['previous']
+        return forward, backward + forward[-1:]
+
+
+class CatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menu_item('4.00', title='Soup')
+        self.client_ = self.client_for(self.customer)
+
+    def test_second_read_is_a_hit(self):
+        self.assertEqual(self.client_.get('/api/menu-items')['X-Cache'], 'MISS')
+
+        response = self.client_.get('/api/menu-items')
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual([row['title'] for row in response.json()], ['Soup'])
+
+    def test_write_invalidates_once_committed(self):
+        self.client_.get('/api/menu-items')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item('5.00', title='Bread')
+
+        response = self.client_.get('/api/menu-items')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 2)
+
+    def test_write_in_another_worker_invalidates(self):
+        self.client_.get('/api/menu-items')
+
+        # Another process bumping the version through its own connection.
+        SQLiteCounterStore(self.scratch / 'shared.sqlite3').incr('catalog:version', 0)
+
+        self.assertEqual(self.client_.get('/api/menu-items')['X-Cache'], 'MISS')
+
+    def test_version_is_read_once_per_request(self):
+        with mock.patch.object(SQLiteCounterStore, 'get', autospec=True, side_effect=SQLiteCounterStore.get) as get:
+            for expected in ('MISS', 'HIT'):
+                get.reset_mock()
+                response = self.client_.get('/api/menu-items')
+                self.assertEqual(response['X-Cache'], expected)
+                reads = [call for call in get.call_args_list if call.args[1] == 'catalog:version']
+                self.assertEqual(len(reads), 1)
+                self.assertIn(str(reads[0].args[0].get('catalog:version', 0)), response['ETag'])
+
+
+class KeysetTests(APITestCase):
+
+    def assertRoundTrip(self, client, path, params, expected):
+        forward, backward = self.walk(client, path, params)
+        self.assertEqual(sum(forward, []), expected)
+        self.assertEqual(backward, forward)
+
+    def test_decimal_ordering(self):
+        rng = random.Random(2)
+        items = [self.menu_item(f'{rng.randint(1, 6)}.{rng.choice(("05", "50", "95"))}') for n in range(17)]
+        client = self.client_for(self.customer)
+
+        for ordering, key in [
+            ('price', lambda item: (item.price, item.id)),
+            ('-price', lambda item: (-item.price, item.id)),
+        ]:
+            with self.subTest(ordering=ordering):
+                expected = [item.id for item in sorted(items, key=key)]
+                self.assertRoundTrip(client, '/api/menu-items', {'ordering': ordering, 'per_page': 4}, expected)
+
+    def test_nullable_ordering(self):
+        crews = [None, self.crew, self.manager]
+        orders = [self.order(delivery_crew=crews[n % 3]) for n in range(14)]
+        client = self.client_for(self.manager)
+
+        # Nulls come first ascending and last descending.
+        for ordering, key in [
+            ('delivery_crew', lambda order: (order.delivery_crew_id is not None, order.delivery_crew_id or 0, order.id)),
+            ('-delivery_crew', lambda order: (order.delivery_crew_id is None, -(order.delivery_crew_id or 0), order.id)),
+        ]:
+            with self.subTest(ordering=ordering):
+                expected = [order.id for order in sorted(orders, key=key)]
+                self.assertRoundTrip(client, '/api/orders', {'ordering': ordering, 'per_page': 3}, expected)
+
+    def test_explicit_id_direction(self):
+        items = [self.menu_item(f'{n % 3 + 1}.00') for n in range(11)]
+        client = self.client_for(self.customer)
+
+        for ordering, key in [
+            ('-id', lambda item: -item.id),
+            ('price,-id', lambda item: (item.price, -item.id)),
+            ('-id,price', lambda item: -item.id),
+        ]:
+            with self.subTest(ordering=ordering):
+                expected = [item.id for item in sorted(items, key=key)]
+                self.assertRoundTrip(client, '/api/menu-items', {'ordering': ordering, 'per_page': 4}, expected)
+
+    def test_cursor_is_read_from_the_query_string(self):
+        factory = APIRequestFactory()
+        parsers = [JSONParser()]
+
+        self.assertIsNone(get_cursor(Request(factory.post('/api/menu-items', {'cursor': 'abc'}, format='json'), parsers=parsers)))
+        self.assertEqual(get_cursor(Request(factory.post('/api/menu-items?cursor=abc', {}, format='json'), parsers=parsers)), 'abc')
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client_for(self.customer).get('/api/menu-items?cursor=garbage').status_code, 400)
+
+    def test_async_pages_match(self):
+        items = MenuItem.objects.order_by('id')
+        for n in range(5):
+            self.menu_item(f'{n}.50')
+        paginator = KeysetPaginator(items, ['-price'], 2)
+        first = paginator.page()
+        second = async_to_sync(paginator.apage)(first.next_cursor)
+
+        self.assertEqual(vars(second), vars(paginator.page(first.next_cursor)))
+        everything = list(items.all())
+        for page, per_page, expected in (
+            (1, None, everything), (2, None, []), (2, 2, everything[2:4]), (3, 2, everything[4:]), (4, 2, []),
+        ):
+            with self.subTest(page=page, per_page=per_page):
+                self.assertEqual(async_to_sync(apaginate)(items.all(), page, per_page), expected)
+
+
+class CheckoutTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.customer)
+        for item, quantity in ((self.menu_item('2.50'), 2), (self.menu_item('0.10'), 3)):
+            Cart.objects.create(user=self.customer, menuitem=item, quantity=quantity, unit_price=item.price, price=item.price * quantity)
+
+    def test_checkout(self):
+        response = self.client.post('/api/orders')
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get(user=self.customer)
+        self.assertEqual(order.total, Decimal('5.30'))
+        self.assertEqual(order.order_items.count(), 2)
+        self.assertFalse(Cart.objects.filter(user=self.customer).exists())
+
+    def test_empty_cart(self):
+        Cart.objects.all().delete()
+        self.assertEqual(self.client.post('/api/orders').status_code, 404)
+
+    def test_cart_changed_during_checkout(self):
+        bulk_create = OrderItem.objects.bulk_create
+
+        def concurrent_edit(*args, **kwargs):
+            # Another request removes a line after the cart was read.
+            Cart.objects.filter(user=self.customer).first().delete()
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(OrderItem.objects, 'bulk_create', concurrent_edit):
+            response = self.client.post('/api/orders')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class OrderTotalTests(APITestCase):
+
+    def test_total_is_rounded_to_the_cent(self):
+        dime, two_dimes = self.menu_item('0.10'), self.menu_item('0.20')
+        order = self.order(items=[(dime, 1), (two_dimes, 2)])
+        line = order.order_items.get(menuitem=two_dimes)
+
+        response = self.client_for(self.customer).patch(f'/api/orders/{order.id}/order-items/{line.id}', {'quantity': 1}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        # 0.10 + 0.20 summed as floats is 0.30000000000000004.
+        self.assertEqual(list(Order.objects.filter(total=Decimal('0.30')).values_list('id', flat=True)), [order.id])
+        self.assertFalse(Order.objects.with_drift().exists())
+
+    def test_keyset_pages_by_total(self):
+        rng = random.Random(4)
+        prices = [self.menu_item(price) for price in ('0.10', '0.20', '0.70', '1.10', '2.20')]
+        orders = [
+            self.order(items=[(item, rng.randint(1, 3)) for item in rng.sample(prices, rng.randint(1, 4))], date=date(2024, 1, 1) + timedelta(days=n % 3))
+            for n in range(23)
+        ]
+        client = self.client_for(self.manager)
+
+        for ordering, key in [
+            ('total', lambda order: (order.total, order.id)),
+            ('-total', lambda order: (-order.total, order.id)),
+            ('-date,-total', lambda order: (-order.date.toordinal(), -order.total, order.id)),
+        ]:
+            with self.subTest(ordering=ordering):
+                expected = [order.id for order in sorted(orders, key=key)]
+                forward, backward = self.walk(client, '/api/orders', {'ordering': ordering, 'per_page': 5})
+                self.assertEqual(sum(forward, []), expected)
+                self.assertEqual(backward, forward)
+
+
+class OrderItemTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.item = self.menu_item('2.50')
+        self.order_ = self.order(items=[(self.item, 1)])
+        self.line = self.order_.order_items.get()
+        self.url = f'/api/orders/{self.order_.id}/order-items/{self.line.id}'
+
+    def test_patch_recomputes_the_total(self):
+        response = self.client_for(self.customer).patch(self.url, {'quantity': 3}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.get(id=self.order_.id).total, Decimal('7.50'))
+
+    def test_patch_rejects_quantities_out_of_range(self):
+        client = self.client_for(self.customer)
+        for quantity in (0, -1, 32768, 1.9, True, 'two'):
+            with self.subTest(quantity=quantity):
+                response = client.patch(self.url, {'quantity': quantity}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'message': 'Quantity must be a whole number from 1 to 32767'})
+        self.assertEqual(client.patch(self.url, {}, format='json').json(), {'message': 'Fields missing'})
+        self.assertEqual(Order.objects.get(id=self.order_.id).total, Decimal('2.50'))
+
+    def test_delete_by_owner_or_admin_only(self):
+        other = self.order(items=[(self.menu_item('1.00'), 1), (self.item, 1)])
+        first = other.order_items.order_by('id').first()
+
+        self.assertEqual(self.client_for(self.customer).delete(self.url).status_code, 200)
+        self.assertEqual(self.client_for(self.crew).delete(f'/api/orders/{other.id}/order-items/{first.id}').status_code, 404)
+        self.assertEqual(self.client_for(self.admin).delete(f'/api/orders/{other.id}/order-items/{first.id}').status_code, 200)
+        self.assertEqual(Order.objects.get(id=other.id).total, Decimal('2.50'))
+
+
+class FetchPlanTests(APITestCase):
+
+    def queries(self, client, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_order_list_queries_do_not_grow_with_the_page(self):
+        items = [self.menu_item('1.00'), self.menu_item('2.00')]
+        for n in range(12):
+            self.order(items=[(item, 1) for item in items], delivery_crew=self.crew)
+        client = self.client_for(self.manager)
+
+        self.assertEqual(
+            self.queries(client, '/api/orders', {'ordering': 'id', 'per_page': 2}),
+            self.queries(client, '/api/orders', {'ordering': 'id', 'per_page': 12}),
+        )
+
+    def test_order_detail_renders_its_items(self):
+        order = self.order(items=[(self.menu_item('1.00'), 2), (self.menu_item('0.50'), 1)])
+        client = self.client_for(self.customer)
+
+        response = client.get(f'/api/orders/{order.id}')
+
+        self.assertEqual(response.json()['total'], '2.50')
+        self.assertEqual(sorted(row['quantity'] for row in response.json()['order_items']), [1, 2])
+
+
+class RoleTests(APITestCase):
+
+    def request_for(self, user):
+        request = APIRequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_roles_are_loaded_once_per_request(self):
+        request = self.request_for(self.manager)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(roles.is_manager_or_admin(request))
+            self.assertTrue(roles.is_manager(request))
+            self.assertFalse(roles.is_delivery_crew(request))
+
+    def test_membership_change_reloads_in_flight_requests(self):
+        request = self.request_for(self.customer)
+        self.assertFalse(roles.is_manager(request))
+
+        response = self.client_for(self.admin).post('/api/groups/manager/users', {'username': 'customer'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(roles.is_manager(request))
+        self.assertEqual(self.client_for(self.customer).get('/api/groups/manager/users').status_code, 200)
+
+    def test_group_ids_are_forgotten_when_groups_change(self):
+        self.assertEqual(roles.group_id(roles.MANAGER), self.managers.id)
+        with self.assertNumQueries(0):
+            roles.group_id(roles.MANAGER)
+
+        self.managers.delete()
+        replacement = Group.objects.create(name=roles.MANAGER)
+
+        self.assertEqual(roles.group_id(roles.MANAGER), replacement.id)
+
+    def test_crew_status_update_reads_groups_once(self):
+        order = self.order(delivery_crew=self.crew)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_for(self.crew).patch(f'/api/orders/{order.id}', {'status': 1}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum('auth_user_groups' in query['sql'] for query in queries), 1)
+        self.assertTrue(Order.objects.get(id=order.id).status)
+
+    def test_async_roles_share_the_memo(self):
+        request = self.request_for(self.manager)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(roles.aroles)(request), {roles.MANAGER})
+            self.assertTrue(roles.is_manager(request))
+
+
+class TokenCacheTests(APITestCase):
+
+    def get_with(self, token):
+        return APIClient().get('/api/orders', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def test_warm_request_skips_the_token_lookup(self):
+        token = Token.objects.create(user=self.customer)
+        self.assertEqual(self.get_with(token).status_code, 200)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_with(token).status_code, 200)
+
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries))
+
+    def test_deleted_token_is_dropped_by_every_worker(self):
+        token = Token.objects.create(user=self.customer)
+        other_worker = TokenCache(check_interval=0, counters=token_cache.counters)
+        other_worker.set(token.key, self.customer, token)
+
+        self.assertEqual(self.get_with(token).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            token.delete()
+
+        self.assertIsNone(other_worker.get(token.key))
+        self.assertEqual(self.get_with(token).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        token = Token.objects.create(user=self.customer)
+        self.assertEqual(self.get_with(token).status_code, 200)
+
+        self.customer.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.save()
+
+        self.assertEqual(self.get_with(token).status_code, 401)
+
+    def test_password_change_is_dropped_by_every_worker(self):
+        token = Token.objects.create(user=self.customer)
+        other_worker = TokenCache(check_interval=0, counters=token_cache.counters)
+        other_worker.set(token.key, self.customer, token)
+
+        self.customer.set_password('changed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.save(update_fields=['password'])
+
+        self.assertIsNone(other_worker.get(token.key))
+
+    def test_other_changes_keep_the_cache(self):
+        tokens = [Token.objects.create(user=user) for user in (self.customer, self.manager)]
+        other_worker = TokenCache(check_interval=0, counters=token_cache.counters)
+        for token in tokens:
+            other_worker.set(token.key, token.user, token)
+
+        self.customer.first_name = 'Ann'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.customer.save()
+            self.customer.save(update_fields=['last_login'])
+            tokens[1].delete()
+
+        # Only the manager, whose token went, is dropped.
+        self.assertIsNotNone(other_worker.get(tokens[0].key))
+        self.assertIsNone(other_worker.get(tokens[1].key))
+
+    def test_counters_are_read_once_per_check_interval(self):
+        token = Token.objects.create(user=self.customer)
+        worker = TokenCache(check_interval=60, counters=token_cache.counters)
+        worker.set(token.key, self.customer, token)
+
+        with mock.patch.object(token_cache.counters, 'get', wraps=token_cache.counters.get) as get:
+            for n in range(3):
+                self.assertEqual(worker.get(token.key), (self.customer, token))
+            self.assertEqual(get.call_count, 0)
+
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 60):
+                self.assertEqual(worker.get(token.key), (self.customer, token))
+            self.assertEqual(get.call_count, 1)
+
+    def test_async_authentication_shares_the_cache(self):
+        token = Token.objects.create(user=self.customer)
+        authenticate = async_to_sync(CachedTokenAuthentication().aauthenticate)
+
+        self.assertEqual(authenticate(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Token {token.key}')), (self.customer, token))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_with(token).status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql'] for query in queries))
+        with self.assertRaises(AuthenticationFailed):
+            authenticate(APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token unknown'))
+        self.assertIsNone(authenticate(APIRequestFactory().get('/')))
+
+
+class ThrottleTests(APITestCase):
+
+    def test_workers_draw_from_one_bucket(self):
+        path = self.scratch / 'buckets.sqlite3'
+        first, second = SQLiteBucketStore(path), SQLiteBucketStore(path)
+
+        self.assertEqual(first.take('user:1', capacity=2, rate=1, now=100), 0)
+        self.assertEqual(second.take('user:1', capacity=2, rate=1, now=100), 0)
+        self.assertAlmostEqual(first.take('user:1', capacity=2, rate=1, now=100), 1)
+        self.assertEqual(second.take('user:1', capacity=2, rate=1, now=101), 0)
+        self.assertEqual(second.take('user:2', capacity=2, rate=1, now=101), 0)
+
+    def test_view_scope_is_throttled(self):
+        client = self.client_for(self.customer)
+        with mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {**TokenBucketThrottle.THROTTLE_RATES, 'cart': '2/minute'}):
+            statuses = [client.get('/api/cart/menu-items').status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_categories_and_order_items_have_scopes(self):
+        order = self.order(items=[(self.menu_item('4.00'), 1)])
+        item = order.order_items.get()
+        client = self.client_for(self.customer)
+
+        for scope, path in [
+            ('categories', '/api/categories'),
+            ('order-item', f'/api/orders/{order.id}/order-items/{item.id}'),
+        ]:
+            with self.subTest(scope=scope), mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {**TokenBucketThrottle.THROTTLE_RATES, scope: '1/minute'}):
+                statuses = [client.get(path).status_code for _ in range(2)]
+                self.assertEqual(statuses, [200, 429])
+
+
+class SQLiteBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.path = Path(scratch.name) / 'db.sqlite3'
+        self.db = connections['scratch'] = DatabaseWrapper({**settings.DATABASES['default'], 'NAME': str(self.path)}, alias='scratch')
+        self.addCleanup(connections.__delitem__, 'scratch')
+        self.addCleanup(self.db.close)
+
+    def pragma(self, name):
+        with self.db.cursor() as cursor:
+            return cursor.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def test_pragmas_apply_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+
+    def test_atomic_takes_the_write_lock_up_front(self):
+        self.db.ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+
+        with transaction.atomic(using='scratch'):
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        patcher = mock.patch('LittleLemon.db.routers.fresh_replicas', return_value=['replica'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def route(self, method, path, write=False):
+        """Where an Order read goes inside ``method path``, after a write if ``write``."""
+        request = RequestFactory().generic(method, path)
+        request.resolver_match = resolve(path)
+
+        def view(request):
+            if write:
+                ReplicaRouter().db_for_write(Order)
+            return HttpResponse(ReplicaRouter().db_for_read(Order))
+
+        return ReplicaPinningMiddleware(view)(request).content.decode()
+
+    def test_listings_and_exports_read_from_a_replica(self):
+        for path in ('/api/menu-items', '/api/categories', '/api/orders', '/api/orders/export.csv'):
+            with self.subTest(path=path):
+                self.assertEqual(self.route('GET', path), 'replica')
+
+    def test_single_resources_read_from_the_primary(self):
+        # A client fetching the order it has just placed must find it.
+        for path in ('/api/orders/1', '/api/menu-items/1', '/api/orders/1/order-items/1'):
+            with self.subTest(path=path):
+                self.assertEqual(self.route('GET', path), 'default')
+
+    def test_writes_pin_the_request(self):
+        self.assertEqual(self.route('POST', '/api/orders'), 'default')
+        self.assertEqual(self.route('GET', '/api/orders', write=True), 'default')
+
+    def test_async_requests_are_routed_alike(self):
+        async def view(request):
+            return HttpResponse(ReplicaRouter().db_for_read(Order))
+
+        for path, alias in (('/api/orders', 'replica'), ('/api/orders/1', 'default')):
+            with self.subTest(path=path):
+                request = RequestFactory().get(path)
+                request.resolver_match = resolve(path)
+                response = async_to_sync(ReplicaPinningMiddleware(view))(request)
+                self.assertEqual(response.content.decode(), alias)
+
+    def test_unreplicated_models_are_left_to_django(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(User))
+
+
+class SyncReplicaTests(SimpleTestCase):
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.primary, self.replica = Path(scratch.name) / 'primary.sqlite3', Path(scratch.name) / 'replica.sqlite3'
+        patcher = mock.patch.dict(connections.settings, {
+            'default': {**connections.settings['default'], 'NAME': self.primary},
+            'replica': {**connections.settings['replica'], 'NAME': self.replica},
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(routers._lag_cache.clear)
+        routers._lag_cache.clear()
+
+    def test_copies_the_primary_and_stamps_the_replica(self):
+        with sqlite3.connect(self.primary) as primary:
+            primary.execute('CREATE TABLE item (title TEXT)')
+            primary.execute("INSERT INTO item VALUES ('Soup')")
+        primary.close()
+        self.assertIsNone(routers.replica_lag('replica'))
+
+        call_command('sync_replica', database=['replica'], stdout=io.StringIO())
+
+        replica = sqlite3.connect(self.replica)
+        self.addCleanup(replica.close)
+        self.assertEqual(replica.execute('SELECT title FROM item').fetchall(), [('Soup',)])
+        routers._lag_cache.clear()
+        self.assertLess(routers.replica_lag('replica'), 5)
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(routers.fresh_replicas(), ['replica'])
+
+    def test_stale_replica_is_skipped(self):
+        call_command('sync_replica', database=['replica'], stdout=io.StringIO())
+        stamp = routers.sync_stamp_path('replica')
+        os.utime(stamp, (time.time() - 60, time.time() - 60))
+
+        with override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG=5):
+            self.assertEqual(routers.fresh_replicas(), [])
+
+class GeneratorTests(APITestCase):
+
+    def test_carts_write_the_requested_rows(self):
+        for n in range(4):
+            self.menu_item('1.00')
+        generator = DataGenerator(seed=1)
+        generator.users(5)
+
+        self.assertEqual(generator.carts(7, items_per_cart=3), 7)
+        self.assertEqual(Cart.objects.count(), 7)
+        self.assertEqual(Cart.objects.values('user').distinct().count(), 3)
+
+    def test_generated_orders_are_stamped(self):
+        for n in range(4):
+            self.menu_item('1.00')
+        generator = DataGenerator(seed=1)
+        generator.users(5)
+
+        generator.orders(6, items_per_order=2)
+
+        self.assertEqual(Order.objects.filter(updated__isnull=False).count(), 6)
+
+    def test_orders_without_menu_items_are_empty(self):
+        generator = DataGenerator(seed=1)
+        generator.users(5)
+
+        generator.orders(3)
+        generator.orders(2, items_per_order=0)
+
+        self.assertEqual(Order.objects.filter(total=0).count(), 5)
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.series.clear()
+
+    def scrape(self):
+        response = self.client_for(self.admin).get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_counted_per_view(self):
+        client = self.client_for(self.customer)
+        for _ in range(3):
+            client.get('/api/categories')
+
+        self.assertIn('littlelemon_requests_total{view="CategoriesView",method="GET",status="2xx"} 3\n', self.scrape())
+
+    def test_snapshots_of_other_workers_are_summed(self):
+        self.client_for(self.customer).get('/api/categories')
+        other = self.scratch / 'metrics' / 'other.json'
+        other.write_text(json.dumps(metrics.registry.snapshot() | {'pid': 0}))
+        self.addCleanup(other.unlink)
+
+        self.assertIn('littlelemon_requests_total{view="CategoriesView",method="GET",status="2xx"} 2\n', self.scrape())
+
+    def test_exited_workers_are_retired(self):
+        self.client_for(self.customer).get('/api/categories')
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        snapshot = self.scratch / 'metrics' / f'{exited.pid}.json'
+        snapshot.parent.mkdir(exist_ok=True)
+        snapshot.write_text(json.dumps(metrics.registry.snapshot() | {'pid': exited.pid}))
+        self.addCleanup((self.scratch / 'metrics' / metrics.RETIRED).unlink, missing_ok=True)
+
+        # Folded in once: the second scrape counts it from retired.json.
+        for _ in range(2):
+            self.assertIn('littlelemon_requests_total{view="CategoriesView",method="GET",status="2xx"} 2\n', self.scrape())
+            self.assertFalse(snapshot.exists())
+
+    def test_admin_only(self):
+        self.assertEqual(self.client_for(self.manager).get('/api/metrics').status_code, 403)
+
+    def test_scrapers_by_token_or_address(self):
+        with override_settings(METRICS_SCRAPE_TOKEN='secret', METRICS_ALLOWED_IPS=['10.0.0.5']):
+            for headers, status_code in [
+                ({'HTTP_AUTHORIZATION': 'Bearer secret'}, 200),
+                ({'HTTP_AUTHORIZATION': 'Bearer wrong'}, 401),
+                ({'REMOTE_ADDR': '10.0.0.5'}, 200),
+                ({'REMOTE_ADDR': '10.0.0.6'}, 401),
+            ]:
+                with self.subTest(headers=headers):
+                    self.assertEqual(APIClient().get('/api/metrics', **headers).status_code, status_code)
+
+    def test_observer_sees_async_orm_queries(self):
+        seen = []
+
+        async def count():
+            with metrics.observing_queries(lambda alias, sql, *args: seen.append(sql)):
+                return await MenuItem.objects.acount()
+
+        self.assertEqual(async_to_sync(count)(), 0)
+        self.assertEqual(len(seen), 1)
+        self.assertEqual(metrics._observers.get(), ())
+
+
+class ProfilingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        profile_dir = override_settings(PROFILE_DIR=self.scratch / 'profiles')
+        profile_dir.enable()
+        self.addCleanup(profile_dir.disable)
+        self.token = Token.objects.create(user=self.admin)
+
+    def profiled_get(self):
+        return APIClient().get('/api/categories', HTTP_AUTHORIZATION=f'Token {self.token.key}', HTTP_X_PROFILE='cprofile')
+
+    def test_capture(self):
+        response = self.profiled_get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(profiling.capture_path(response['X-Profile-Id'] + '.prof'))
+
+    def test_busy_profiler_serves_the_request_unprofiled(self):
+        with profiling._cprofile_busy:
+            response = self.profiled_get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn('X-Profile-Id', self.profiled_get())
+
+    def test_refused_profiler_serves_the_request_unprofiled(self):
+        with mock.patch('cProfile.Profile.enable', side_effect=ValueError('Another profiling tool is already active')):
+            response = self.profiled_get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(metrics._observers.get(), ())
+        self.assertIn('X-Profile-Id', self.profiled_get())
+
+    def test_async_capture_logs_the_queries(self):
+        async def view(request):
+            return HttpResponse(str(await MenuItem.objects.acount()))
+
+        async def auser():
+            return self.admin
+
+        request = RequestFactory().get('/', HTTP_X_PROFILE='stack')
+        request.auser = auser
+        response = async_to_sync(profiling.ProfilingMiddleware(view))(request)
+
+        capture = json.loads(profiling.capture_path(response['X-Profile-Id'] + '.json').read_text())
+        self.assertEqual((capture['mode'], capture['query_count']), ('stack', 1))
+
+    def test_sql_log_leaves_out_parameters(self):
+        response = APIClient().get('/api/categories', HTTP_AUTHORIZATION=f'Token {self.token.key}', HTTP_X_PROFILE='cprofile')
+
+        capture = json.loads(profiling.capture_path(response['X-Profile-Id'] + '.json').read_text())
+        self.assertEqual({tuple(query) for query in capture['sql']}, {('alias', 'sql', 'many', 'ms')})
+
+    def test_stack_sampler_sees_other_threads(self):
+        sampler = profiling.StackSampler(0.001)
+        done = threading.Event()
+        worker = threading.Thread(target=done.wait, name='orm-worker')
+        worker.start()
+        sampler.enable()
+        time.sleep(0.05)
+        sampler.disable()
+        done.set()
+        worker.join()
+
+        self.assertTrue(any(stack.startswith('orm-worker;') for stack in sampler.stacks))
+
+
+class ExportTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        items = [self.menu_item('1.25'), self.menu_item('0.10')]
+        self.orders = [
+            self.order(items=[(item, n % 3 + 1) for item in items[:n % 2 + 1]], status=bool(n % 2),
+                       delivery_crew=self.crew if n % 3 else None, date=date(2024, 1, 1) + timedelta(days=n))
+            for n in range(7)
+        ]
+        self.client_ = self.client_for(self.manager)
+
+    def export(self, fmt, query=''):
+        response = self.client_.get(f'/api/orders/export.{fmt}{query}')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_rows_match_the_order_serializer(self):
+        # Chunks of three, so orders and their items span several chunks.
+        with mock.patch.object(export.ndjson_stream, '__defaults__', (3,)):
+            rows = [json.loads(line) for line in self.export('ndjson').splitlines()]
+
+        expected = OrdersSerializer(Order.objects.order_by('id'), many=True).data
+        self.assertEqual(rows, json.loads(json.dumps(expected)))
+
+    def test_csv_has_one_row_per_item(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', '?status=1&date_from=2024-01-03'))))
+
+        expected = OrderItem.objects.filter(order__status=True, order__date__gte=date(2024, 1, 3))
+        self.assertEqual(sorted(int(row['item_id']) for row in rows), sorted(expected.values_list('id', flat=True)))
+        self.assertEqual({row['status'] for row in rows}, {'1'})
+
+    def test_filters_match_the_order_listing(self):
+        # The same spellings as GET /api/orders.
+        self.assertEqual(self.export('csv', f'?status=true&delivery_crew={self.crew.id}'), self.export('csv', f'?status=1&delivery_crew={self.crew.id}'))
+        rows = list(csv.DictReader(io.StringIO(self.export('csv', '?status=false'))))
+        self.assertEqual({row['status'] for row in rows}, {'0'})
+
+    def test_filters_are_validated(self):
+        for query in ('?status=yes', '?date_from=January', '?delivery_crew=x', '?delivery_crew=1.5'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client_.get(f'/api/orders/export.csv{query}').status_code, 400)
+        self.assertEqual(self.client_.get('/api/orders/export.xml').status_code, 404)
+
+    def test_managers_only(self):
+        self.assertEqual(self.client_for(self.customer).get('/api/orders/export.csv').status_code, 401)
+
+
+class ConditionalTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.menu_item('4.00', title='Soup')
+        self.client_ = self.client_for(self.customer)
+
+    def test_catalog_write_invalidates_cache_and_etag(self):
+        first = self.client_.get('/api/menu-items')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertNotIn('Last-Modified', first)
+        self.assertEqual(self.client_.get('/api/menu-items')['X-Cache'], 'HIT')
+        self.assertEqual(self.client_.get('/api/menu-items', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item('5.00', title='Bread')
+
+        second = self.client_.get('/api/menu-items', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertEqual(len(second.json()), 2)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_write_in_another_worker_invalidates(self):
+        first = self.client_.get('/api/menu-items')
+
+        # Another process bumping the version through its own connection.
+        SQLiteCounterStore(self.scratch / 'shared.sqlite3').incr('catalog:version', 0)
+
+        second = self.client_.get('/api/menu-items', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['X-Cache'], 'MISS')
+
+    def test_order_etag(self):
+        order = self.order(items=[(MenuItem.objects.get(), 1)])
+        first = self.client_.get(f'/api/orders/{order.id}')
+        self.assertEqual(self.client_.get(f'/api/orders/{order.id}', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        line = order.order_items.get()
+        self.client_.patch(f'/api/orders/{order.id}/order-items/{line.id}', {'quantity': 2}, format='json')
+
+        self.assertEqual(self.client_.get(f'/api/orders/{order.id}', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class ListingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        self.items = [self.menu_item(price) for price in ('1.50', '3.00', '4.25', '6.00')]
+        self.items.append(MenuItem.objects.create(title='Lemonade', price=Decimal('2.00'), category=drinks))
+        self.client_ = self.client_for(self.customer)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()]
+
+    def test_parameters_come_from_the_query_string(self):
+        response = self.client_.get('/api/menu-items?price_from=2&price_to=5&ordering=-price')
+
+        self.assertEqual(self.ids(response), [self.items[2].id, self.items[1].id, self.items[4].id])
+        self.assertEqual(self.ids(self.client_.get('/api/menu-items?category=drink')), [self.items[4].id])
+
+    def test_body_is_a_fallback(self):
+        body = json.dumps({'ordering': '-price', 'per_page': 2})
+        response = self.client_.generic('GET', '/api/menu-items?page=2', body, content_type='application/json')
+
+        self.assertEqual(self.ids(response), [self.items[1].id, self.items[4].id])
+
+    def test_invalid_values_are_rejected_before_querying(self):
+        for query, message in [
+            ('per_page=0', 'Value error'),
+            ('per_page=1.5', 'Value error'),
+            ('page=-1', 'Value error'),
+            ('price_from=NaN', 'Value error'),
+            ('ordering=category__slug', 'Field error'),
+            ('ordering=-secret', 'Field error'),
+        ]:
+            with self.subTest(query=query), self.assertNumQueries(0):
+                response = self.client_.get(f'/api/menu-items?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'message': message})
+
+    def test_equivalent_queries_share_a_cache_entry(self):
+        self.assertEqual(self.client_.get('/api/menu-items?category=Drinks&price_to=10.0&ordering=price,price')['X-Cache'], 'MISS')
+
+        response = self.client_.get('/api/menu-items?ordering=price&price_to=10&category=drinks')
+
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.ids(response), [self.items[4].id])
+
+    def test_order_status(self):
+        open_, delivered = self.order(), self.order(status=True)
+        client = self.client_for(self.manager)
+
+        for value, expected in (('0', [open_.id]), ('false', [open_.id]), ('true', [delivered.id])):
+            with self.subTest(status=value):
+                self.assertEqual(self.ids(client.get(f'/api/orders?status={value}')), expected)
+        self.assertEqual(client.get('/api/orders?status=maybe').status_code, 400)
+
+class SearchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ('Greek salad', 'Green soup', 'Grilled fish', 'Bread'):
+            self.menu_item('3.00', title=title)
+        self.client_ = self.client_for(self.customer)
+
+    def test_ranked_search(self):
+        titles = [row['title'] for row in self.client_.get('/api/menu-items?search=gre').json()]
+        self.assertEqual(sorted(titles), ['Greek salad', 'Green soup'])
+
+    def test_cursor_needs_an_ordering_with_search(self):
+        response = self.client_.get('/api/menu-items?search=gr&cursor=')
+        self.assertEqual(response.status_code, 400)
+
+        forward, backward = self.walk(self.client_, '/api/menu-items', {'search': 'gr', 'ordering': '-title', 'per_page': 2})
+        self.assertEqual(forward, backward)
+        titles = MenuItem.objects.in_bulk(sum(forward, []))
+        self.assertEqual([titles[id].title for id in sum(forward, [])], ['Grilled fish', 'Green soup', 'Greek salad'])
+
+
+class BenchmarkTests(SimpleTestCase):
+
+    def test_every_route_but_the_event_stream_has_a_scenario(self):
+        class Row:
+            # Stands in for any seeded row or setup state a path refers to.
+            id = 1
+
+            def __getitem__(self, key):
+                return self
+
+            def __str__(self):
+                return 'capture'
+
+        covered = {
+            resolve(scenario.path(Row(), Row()) if callable(scenario.path) else scenario.path.split('?')[0]).route
+            for scenario in benchmark.SCENARIOS
+        }
+        routes = {f'api/{pattern.pattern}' for pattern in importlib.import_module('LittleLemonAPI.urls').urlpatterns}
+
+        self.assertEqual(routes - covered, {'api/orders/events'})
+
+
+class QueryPlanTests(SimpleTestCase):
+    order = 'LittleLemonAPI_order'
+
+    def suggest(self, where, order_by='"LittleLemonAPI_order"."date" ASC'):
+        sql = f'SELECT "{self.order}"."id" FROM "{self.order}" WHERE {where} ORDER BY {order_by}'
+        return queryplan.suggest(sql, queryplan.Problem('temp-btree', self.order, self.order, 'USE TEMP B-TREE FOR ORDER BY'))
+
+    def test_equality_then_ordering(self):
+        self.assertEqual(
+            self.suggest('"LittleLemonAPI_order"."status" IN (0) AND "LittleLemonAPI_order"."delivery_crew_id" IS NULL'),
+            queryplan.Suggestion(self.order, ('status', 'delivery_crew_id', 'date')),
+        )
+
+    def test_primary_key_lookup_needs_no_index(self):
+        self.assertIsNone(self.suggest('"LittleLemonAPI_order"."status" IN (0) AND "LittleLemonAPI_order"."id" IN (1, 2, 3)'))
+
+    def test_primary_key_range_is_not_a_candidate(self):
+        self.assertEqual(
+            self.suggest('"LittleLemonAPI_order"."status" IN (0) AND "LittleLemonAPI_order"."id" > 10'),
+            queryplan.Suggestion(self.order, ('status', 'date')),
+        )
+
+
+class FastSerializerTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        drinks = Category.objects.create(slug='drinks', title='Drinks')
+        items = [self.menu_item('12.50', 'Lasagne'), self.menu_item('0.10', 'Mint'), self.menu_item('3', 'Lemonade')]
+        MenuItem.objects.filter(id=items[2].id).update(category=drinks, featured=True)
+        self.order(items=[(items[0], 2), (items[1], 3)], delivery_crew=self.crew, date=date(2024, 2, 29))
+        self.order(items=[(items[2], 1)], status=True)
+        self.order(user=self.manager)
+
+    def test_same_bytes_as_drf(self):
+        client = self.client_for(self.manager)
+        for path in (
+            '/api/menu-items',
+            '/api/menu-items?ordering=-price&per_page=2',
+            '/api/menu-items?ordering=price&per_page=2&cursor=',
+            '/api/orders',
+            '/api/orders?ordering=-total&per_page=2',
+            '/api/orders?ordering=delivery_crew&per_page=2&cursor=',
+        ):
+            with self.subTest(path=path):
+                responses = []
+                for fast in (True, False):
+                    cache.clear()
+                    with override_settings(FAST_SERIALIZERS=fast):
+                        responses.append(client.get(path))
+                self.assertEqual(responses[0].status_code, 200)
+                self.assertEqual(responses[0].content, responses[1].content)
+
+    def test_async_rows_match(self):
+        serializer = rows.RowSerializer(OrdersSerializer)
+        orders = serializer.values(Order.objects.order_by('id'))
+        order = Order.objects.order_by('id').first()
+
+        self.assertEqual(async_to_sync(serializer.aserialize)(orders), serializer.serialize(orders))
+        self.assertEqual(
+            async_to_sync(serializer.aserialize)([serializer.instance_row(order)]),
+            [OrdersSerializer(Order.objects.with_items().get(id=order.id)).data],
+        )
+
+
+class AsyncViewTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.manager).key
+        lasagne, lemonade = self.menu_item('12.50', 'Lasagne'), self.menu_item('3', 'Lemonade')
+        self.first = self.order(user=self.manager, items=[(lasagne, 2), (lemonade, 1)], delivery_crew=self.crew)
+        self.order(items=[(lemonade, 3)], status=True)
+
+    def read(self, path, async_views):
+        cache.clear()
+        with benchmark.read_views(async_views):
+            if async_views:
+                return async_to_sync(AsyncClient().get)(path, headers={'authorization': f'Token {self.token}'})
+            return APIClient().get(path, HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def test_same_responses_as_the_sync_views(self):
+        for path in (
+            '/api/categories',
+            '/api/menu-items',
+            '/api/menu-items?ordering=-price&per_page=1&page=2',
+            '/api/menu-items?ordering=price&per_page=1&cursor=',
+            '/api/menu-items?cursor=garbage',
+            '/api/menu-items?per_page=0',
+            f'/api/menu-items/{self.first.order_items.first().menuitem_id}',
+            '/api/orders',
+            '/api/orders?ordering=-total&per_page=1&cursor=',
+            '/api/orders?status=1&per_page=1&page=1',
+            f'/api/orders/{self.first.id}',
+        ):
+            with self.subTest(path=path):
+                expected, response = self.read(path, False), self.read(path, True)
+                self.assertEqual(
+                    (response.status_code, response.get('ETag'), response.content),
+                    (expected.status_code, expected.get('ETag'), expected.content),
+                )
+
+    def test_shared_state_stays_off_the_event_loop(self):
+        threads = []
+
+        def recorded(method):
+            def record(*args, **kwargs):
+                threads.append((method.__name__, threading.get_ident()))
+                return method(*args, **kwargs)
+            return record
+
+        async def get():
+            response = await AsyncClient().get('/api/menu-items', headers={'authorization': f'Token {self.token}'})
+            return threading.get_ident(), response
+
+        with (
+            benchmark.read_views(True),
+            mock.patch.object(TokenBucketThrottle, 'allow_request', recorded(TokenBucketThrottle.allow_request)),
+            mock.patch.object(SQLiteCounterStore, 'get', recorded(SQLiteCounterStore.get)),
+        ):
+            loop, response = async_to_sync(get)()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({name for name, thread in threads}, {'allow_request', 'get'})
+        self.assertNotIn(loop, {thread for name, thread in threads})
+
+    def test_writes_run_in_a_thread(self):
+        async def post():
+            client = AsyncClient()
+            return await client.post('/api/categories', {'slug': 'drinks', 'title': 'Drinks'}, headers={'authorization': f'Token {self.token}'})
+
+        with benchmark.read_views(True):
+            response = async_to_sync(post)()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Category.objects.filter(slug='drinks').exists())
+
+
+class EventTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory(dir=self.scratch)
+        self.addCleanup(directory.cleanup)
+        self.broker = events.Broker(events.SQLiteEventBackend({'PATH': Path(directory.name) / 'events.sqlite3'}))
+        patcher = mock.patch.object(events, 'broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def published(self):
+        return self.broker.backend.since(0, self.customer.pk)
+
+    def test_backend_io_stays_off_the_event_loop(self):
+        async def publish_on_loop():
+            return self.broker.publish('order', {}, [self.customer.pk])
+
+        with self.assertRaises(SynchronousOnlyOperation):
+            async_to_sync(publish_on_loop)()
+
+    def test_replay(self):
+        first = self.broker.publish('order', {'order': 1}, [self.customer.pk])
+
+        async def replay():
+            published = await self.broker.apublish('order', {'order': 2}, [self.customer.pk, self.crew.pk])
+            body = events.stream(self.customer.pk, first.id - 1, heartbeat=60)
+            chunks = [await anext(body) for _ in range(3)]
+            await body.aclose()
+            return published, chunks
+
+        second, chunks = async_to_sync(replay)()
+
+        self.assertEqual(chunks, [b'retry: 3000\n\n', events.encode(first), events.encode(second)])
+
+    def test_changes_are_published_after_commit(self):
+        order = self.order(delivery_crew=self.crew)
+        other_crew = User.objects.create_user('other-crew')
+        other_crew.groups.add(self.crew_group)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.manager).patch(f'/api/orders/{order.id}', {'delivery_crew': other_crew.id}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        [event] = self.published()
+        self.assertEqual((event.data['order'], event.data['changed']), (order.id, ['delivery_crew']))
+        self.assertEqual(event.users, (self.customer.pk, other_crew.pk, self.crew.pk))
+
+    def test_unchanged_order_publishes_nothing(self):
+        order = self.order(delivery_crew=self.crew, status=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.crew).patch(f'/api/orders/{order.id}', {'status': 1}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.published(), [])
+
+    def test_stream_needs_asgi(self):
+        self.assertEqual(self.client_for(self.customer).get('/api/orders/events').status_code, 501)
+
+
+class DispatchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.manager)
+        self.other_crew = User.objects.create_user('other-crew')
+        self.other_crew.groups.add(self.crew_group)
+
+    def dispatch(self, **data):
+        return self.client.post('/api/orders/dispatch', data, format='json')
+
+    def test_assign_to_crew(self):
+        first, second = self.order(), self.order(delivery_crew=self.crew)
+        delivered = self.order(status=True)
+
+        response = self.dispatch(orders=[first.id, second.id, delivered.id, 999], delivery_crew=self.crew.id)
+
+        self.assertEqual(response.data, {
+            'assigned': {str(self.crew.id): [first.id]}, 'unchanged': [second.id], 'skipped': [], 'rejected': [delivered.id, 999],
+        })
+        first.refresh_from_db()
+        self.assertEqual(first.delivery_crew, self.crew)
+
+    def test_auto_balances_and_skips_assigned_orders(self):
+        self.order(delivery_crew=self.crew)
+        self.order(delivery_crew=self.crew)
+        taken = self.order(delivery_crew=self.other_crew)
+        open_orders = [self.order(date=date(2024, 1, 2) + timedelta(days=n)) for n in range(3)]
+
+        response = self.dispatch(orders=[taken.id, *(order.id for order in open_orders)], auto=True)
+
+        self.assertEqual(response.data, {
+            'assigned': {str(self.other_crew.id): [open_orders[0].id, open_orders[2].id], str(self.crew.id): [open_orders[1].id]},
+            'unchanged': [],
+            'skipped': [taken.id],
+            'rejected': [],
+        })
+
+    def test_ids_must_be_whole_numbers(self):
+        order = self.order()
+        for data in (
+            {'orders': [order.id + 0.9], 'delivery_crew': self.crew.id},
+            {'orders': [True], 'delivery_crew': self.crew.id},
+            {'orders': [0], 'delivery_crew': self.crew.id},
+            {'orders': [], 'delivery_crew': self.crew.id},
+            {'orders': [order.id], 'delivery_crew': self.crew.id + 0.5},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.dispatch(**data).status_code, 400)
+        self.assertIsNone(Order.objects.get(id=order.id).delivery_crew)
+
+    def test_crew_and_auto_are_exclusive(self):
+        self.assertEqual(self.dispatch(orders=[self.order().id], delivery_crew=self.crew.id, auto=True).status_code, 400)
+        self.assertEqual(self.dispatch(orders=[self.order().id]).status_code, 400)
+
+    def test_managers_only(self):
+        self.client = self.client_for(self.crew)
+        self.assertEqual(self.dispatch(orders=[self.order().id], delivery_crew=self.crew.id).status_code, 401)
+
+
+class OrderStatusTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.mine = [self.order(delivery_crew=self.crew), self.order(delivery_crew=self.crew, status=True)]
+        self.theirs = self.order()
+
+    def set_status(self, user, **data):
+        return self.client_for(user).post('/api/orders/status', data, format='json')
+
+    def test_crew_changes_only_their_orders(self):
+        ids = [order.id for order in (*self.mine, self.theirs)]
+
+        response = self.set_status(self.crew, orders=ids + [999], status=1)
+
+        self.assertEqual(response.data, {'changed': [self.mine[0].id], 'unchanged': [self.mine[1].id], 'rejected': [self.theirs.id, 999]})
+        self.assertEqual(list(Order.objects.filter(status=True).order_by('id').values_list('id', flat=True)), [order.id for order in self.mine])
+
+    def test_manager_changes_any_order(self):
+        response = self.set_status(self.manager, orders=[self.theirs.id, self.mine[1].id], status='false')
+
+        self.assertEqual(response.data, {'changed': [self.mine[1].id], 'unchanged': [self.theirs.id], 'rejected': []})
+
+    def test_validation(self):
+        for data in (
+            {'orders': [self.mine[0].id]},
+            {'status': 1},
+            {'orders': [], 'status': 1},
+            {'orders': self.mine[0].id, 'status': 1},
+            {'orders': [self.mine[0].id + 0.5], 'status': 1},
+            {'orders': [self.mine[0].id], 'status': 'delivered'},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.set_status(self.crew, **data).status_code, 400)
+        self.assertFalse(Order.objects.get(id=self.mine[0].id).status)
+
+    def test_customers_cannot_change_status(self):
+        self.assertEqual(self.set_status(self.customer, orders=[self.theirs.id], status=1).status_code, 401)
+
+
+class CartTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.customer)
+        self.soup, self.bread = self.menu_item('4.00', 'Soup'), self.menu_item('1.25', 'Bread')
+
+    def cart(self):
+        return dict(Cart.objects.filter(user=self.customer).values_list('menuitem', 'quantity'))
+
+    def test_batch_upsert(self):
+        self.client.post('/api/cart/menu-items', {'menuitemId': self.soup.id}, format='json')
+
+        response = self.client.post('/api/cart/menu-items', {'items': [
+            {'menuitemId': self.soup.id, 'quantity': 2},
+            {'menuitemId': self.bread.id, 'quantity': 5},
+            {'menuitemId': str(self.bread.id), 'quantity': '3'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {self.soup.id: 2, self.bread.id: 3})
+        self.assertEqual(Cart.objects.get(menuitem=self.bread).price, Decimal('3.75'))
+
+    def test_missing_menu_item_writes_nothing(self):
+        response = self.client.post('/api/cart/menu-items', [{'menuitemId': self.soup.id}, {'menuitemId': 999}], format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['missing'], [999])
+        self.assertEqual(self.cart(), {})
+
+    def test_validation(self):
+        for data in (
+            [],
+            {'items': []},
+            {'quantity': 2},
+            [{'menuitemId': self.soup.id}, 'soup'],
+            {'menuitemId': self.soup.id + 0.9},
+            {'menuitemId': True},
+            {'menuitemId': self.soup.id, 'quantity': 1.5},
+            {'menuitemId': self.soup.id, 'quantity': 0},
+            {'menuitemId': self.soup.id, 'quantity': 32768},
+        ):
+            with self.subTest(data=data):
+                self.assertEqual(self.client.post('/api/cart/menu-items', data, format='json').status_code, 400)
+        self.assertEqual(self.cart(), {})
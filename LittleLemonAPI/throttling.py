@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import threading
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets kept in a small WAL-mode SQLite file, so every worker
+    process on the host draws from the same bucket. Each key holds one row
+    of constant size: the tokens left and when they were last topped up.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle_bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key, capacity, rate, now):
+        """
+        Take one token from the bucket. Returns 0 when a token was taken,
+        otherwise the number of seconds until one becomes available.
+        """
+        params = {'key': key, 'capacity': capacity, 'rate': rate, 'now': now}
+        connection = self._connection()
+        taken = connection.execute(
+            'INSERT INTO throttle_bucket (key, tokens, stamp) VALUES (:key, :capacity - 1, :now) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'tokens = MIN(:capacity, tokens + MAX(0, :now - stamp) * :rate) - 1, stamp = :now '
+            'WHERE MIN(:capacity, tokens + MAX(0, :now - stamp) * :rate) >= 1 '
+            'RETURNING tokens',
+            params,
+        ).fetchone()
+
+        if taken is not None:
+            return 0
+
+        available = connection.execute(
+            'SELECT MIN(:capacity, tokens + MAX(0, :now - stamp) * :rate) FROM throttle_bucket WHERE key = :key',
+            params,
+        ).fetchone()[0]
+        return max(0.0, (1 - available) / rate)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM throttle_bucket')
+
+
+bucket_store = SQLiteBucketStore(getattr(settings, 'THROTTLE_DB', settings.BASE_DIR / 'throttle.sqlite3'))
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Per-user token bucket shared by all workers. The rate comes from the
+    view's ``throttle_scope`` in DEFAULT_THROTTLE_RATES; views without a
+    ``throttle_scope`` use the ``user`` scope. A scope missing from
+    DEFAULT_THROTTLE_RATES raises ImproperlyConfigured.
+    """
+    scope = 'user'
+    store = bucket_store
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', self.scope)
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        if self.rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+
+        self.key = self.cache_format % {'scope': self.scope, 'ident': ident}
+        self.wait_seconds = self.store.take(
+            self.key,
+            capacity=self.num_requests,
+            rate=self.num_requests / self.duration,
+            now=self.timer(),
+        )
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
@@ -1,16 +1,28 @@
+from django.conf import settings
 from django.urls import path, include
-from . import views
+from . import asyncviews, views
+
+# Async read views are for ASGI; under WSGI each would run in its own event loop.
+read_views = asyncviews if settings.ASYNC_READ_VIEWS else views
 
 urlpatterns = [
-    path('categories', views.CategoriesView.as_view()),
-    path('menu-items', views.MenuItemsView.as_view()),
-    path('menu-items/<int:pk>', views.SingleMenuItemView.as_view()),
+    path('categories', read_views.CategoriesView.as_view()),
+    path('menu-items', read_views.MenuItemsView.as_view()),
+    path('menu-items/<int:pk>', read_views.SingleMenuItemView.as_view()),
     path('groups/manager/users', views.ManagersView.as_view()),
     path('groups/manager/users/<int:userId>', views.ManagersView.as_view()),
     path('groups/delivery-crew/users', views.DeliveryCrewsView.as_view()),
     path('groups/delivery-crew/users/<int:userId>', views.DeliveryCrewsView.as_view()),
     path('cart/menu-items', views.CartMenuItemsView.as_view()),
-    path('orders', views.OrderItemsView.as_view()),
-    path('orders/<int:orderId>', views.SingleOrderView.as_view()),
+    path('orders', read_views.OrderItemsView.as_view()),
+    path('orders/export.<str:fmt>', views.OrderExportView.as_view()),
+    path('orders/events', asyncviews.OrderEventsView.as_view()),
+    path('orders/dispatch', views.OrderDispatchView.as_view()),
+    path('orders/status', views.OrderStatusView.as_view()),
+    path('orders/<int:orderId>', read_views.SingleOrderView.as_view()),
     path('orders/<int:orderId>/order-items/<int:orderitemId>', views.OrderMenuitemView.as_view()),
+    path('cache-stats', views.CacheStatsView.as_view()),
+    path('metrics', views.MetricsView.as_view()),
+    path('profiles', views.ProfilesView.as_view()),
+    path('profiles/<str:name>', views.SingleProfileView.as_view()),
 ]
\ No newline at end of file
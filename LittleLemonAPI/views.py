@@ -1,95 +1,216 @@
-from django.forms import ValidationError
 from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework import generics, status
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, BasePermission
-from .models import MenuItem, Category, Cart, Order, OrderItem
+from .models import MenuItem, Category, Cart, Order, OrderItem, items_prefetch
 from .serializers import MenuItemsSerializer, CategorySerializer, SingleMenuItemSerializer, GroupsSerializer, CartItemsSerializer, OrdersSerializer, OrderItemsSerializer, OrderMenuItemSerializer
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from datetime import datetime
+import heapq
 from django.core.paginator import Paginator, EmptyPage
-from rest_framework.throttling import UserRateThrottle
-from decimal import Decimal, InvalidOperation
-import bleach
 from django.core.exceptions import FieldError
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Window, prefetch_related_objects
+from django.utils import timezone
+from .authentication import token_cache
+from .throttling import TokenBucketThrottle
+from .cache import get_catalog, set_catalog, catalog_stats, catalog_version, catalog_validators
+from .conditional import not_modified, with_validators, order_validators
+from .roles import MANAGER, DELIVERY_CREW, aroles, group_id, is_manager_or_admin, is_delivery_crew
+from .pagination import KeysetPage, KeysetPaginator, InvalidCursor, apaginate, get_cursor, cursor_response_data
+from .filters import MenuItemFilter, OrderFilter, OrderDispatchFilter, OrderExportFilter, InvalidFilter, boolean, integer
+from .metrics import IsMetricsScraper, PrometheusRenderer, collect, render_prometheus
+from .profiling import list_captures, capture_path
+from django.http import FileResponse, StreamingHttpResponse
+from .export import STREAMS, CONTENT_TYPES
+from . import events, rows
 
 
 class IsManagerOrIsAdmin(BasePermission):
     
     def has_permission(self, request, view):
-        return request.user.groups.filter(name="Manager").exists() or request.user.is_staff 
+        return is_manager_or_admin(request)
+
+    async def ahas_permission(self, request, view):
+        await aroles(request)
+        return self.has_permission(request, view)
+
+class Listing:
+    """
+    One page of a list GET, by keyset (``cursor``) or by page number, and
+    serialized by the view's row serializer or the DRF serializer it wraps.
+    The async views fetch the same listing with the async ORM.
+    """
+
+    def __init__(self, view, queryset, params, cursor):
+        ordering = list(params['ordering'])
+        self.fast = rows.enabled(view)
+        self.row_serializer = view.row_serializer
+        if self.fast:
+            queryset = self.row_serializer.values(queryset, *(field.lstrip('-') for field in ordering))
+        self.queryset = queryset
+        self.page = params['page']
+        self.per_page = params['per_page']
+        self.cursor = cursor
+        self.paginator = None
+        if cursor is not None:
+            self.paginator = KeysetPaginator(queryset, ordering, self.per_page)
+            if cursor:
+                # Rejected before anything is fetched.
+                self.paginator.decode(cursor)
+
+    def fetch(self):
+        """The serialized rows, as a KeysetPage whose cursors are None without ``cursor``."""
+        if self.paginator is not None:
+            page = self.paginator.page(self.cursor)
+            return KeysetPage(self.serialize(page.object_list), page.next_cursor, page.previous_cursor)
+
+        if self.per_page is None:
+            # Without per_page the whole result set is page 1.
+            objects = self.queryset if self.page == 1 else []
+        else:
+            try:
+                objects = Paginator(self.queryset, per_page=self.per_page).page(number=self.page)
+            except EmptyPage:
+                objects = []
+        return KeysetPage(self.serialize(objects), None, None)
+
+    async def afetch(self):
+        if self.paginator is not None:
+            page = await self.paginator.apage(self.cursor)
+            return KeysetPage(await self.aserialize(page.object_list), page.next_cursor, page.previous_cursor)
+        return KeysetPage(await self.aserialize(await apaginate(self.queryset, self.page, self.per_page)), None, None)
+
+    def serialize(self, objects):
+        if self.fast:
+            return self.row_serializer.serialize(objects)
+        return self.row_serializer.serializer_class(objects, many=True).data
+
+    async def aserialize(self, objects):
+        if self.fast:
+            return await self.row_serializer.aserialize(objects)
+        return self.row_serializer.serializer_class(objects, many=True).data
+
+    def data(self, request, page):
+        if self.cursor is None:
+            return page.object_list
+        return cursor_response_data(request, page.object_list, page.next_cursor, page.previous_cursor)
+
+
+def listing_for(view, queryset, params, cursor):
+    try:
+        return Listing(view, queryset, params, cursor)
+    except InvalidCursor:
+        return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
+    except FieldError:
+        return Response({"message": "Field error"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class CacheStatsView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        catalog = catalog_stats.as_dict()
+        catalog['version'] = catalog_version()
+
+        return Response({"catalog": catalog, "token_auth": token_cache.as_dict()}, status=status.HTTP_200_OK)
+
+class MetricsView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser | IsMetricsScraper]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        return Response(render_prometheus(*collect()), status=status.HTTP_200_OK)
+
+class ProfilesView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(list_captures(), status=status.HTTP_200_OK)
+
+class SingleProfileView(generics.GenericAPIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = capture_path(name)
+        if path is None:
+            return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
 
 class CategoriesView(generics.ListCreateAPIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'categories'
+    replica_reads = True
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
+    def get(self, request, *args, **kwargs):
+        etag = catalog_validators('categories', ())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return with_validators(request, super().get(request, *args, **kwargs), etag)
+
 
 class MenuItemsView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'menu-items'
+    replica_reads = True
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemsSerializer
+    row_serializer = rows.RowSerializer(MenuItemsSerializer)
 
     def get(self, request):
-        items = MenuItem.objects.select_related('category').all()
-
-        category_name = request.data.get('category')
-        min_price = request.data.get('price_from')
-        max_price = request.data.get('price_to')
-        ordering = request.data.get('ordering')
-        per_page = request.data.get('per_page', len(items))
-        
-        try:
-            per_page = int(per_page)
-        except ValueError:
-            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-            
-        page = request.data.get('page', 1)
-        
+        listing = self.start_list(request)
+        if not isinstance(listing, Listing):
+            return listing
+        return self.finish_list(request, listing, listing.fetch())
+
+    def start_list(self, request):
+        """
+        The Listing a GET has to fetch, or its response when the parameters
+        are invalid, the client's copy is current or the page is cached.
+        """
         try:
-            page = int(page)
-        except ValueError:
-            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if category_name:
-            category_name = bleach.clean(category_name)
-            items = items.filter(category__title__icontains=category_name)
+            params = MenuItemFilter(request)
+        except InvalidFilter as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if min_price:
-            try:
-                min_price = Decimal(min_price)
-            except InvalidOperation:
-                return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                items = items.filter(price__gte=min_price)
+        cursor = get_cursor(request)
 
-        if max_price:
-            try:
-                max_price = Decimal(max_price)
-            except InvalidOperation:
-                return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                items = items.filter(price__lte=max_price)
-            
+        if cursor is not None and params['search'] is not None and not params['ordering']:
+            # Keyset pages follow the ordering fields plus id; search
+            # relevance is not a column they can resume from.
+            return Response({"message": "cursor with search needs an explicit ordering"}, status=status.HTTP_400_BAD_REQUEST)
 
-        if ordering:
-            ordering = bleach.clean(ordering)
-            ordering_fields = ordering.split(",")
-            try:
-                items = items.order_by(*ordering_fields)
-            except FieldError:
-                return Response({"message": "Field error"}, status=status.HTTP_400_BAD_REQUEST)
-            
+        cache_params = (params.cache_key(), cursor)
+        version = catalog_version()
+        # Cursor links embed the request URL, so it is part of the ETag.
+        self.etag = catalog_validators('menu-items', (cache_params, request.build_absolute_uri() if cursor is not None else None), version)
+        response = not_modified(request, self.etag)
+        if response is not None:
+            return response
 
-        paginator = Paginator(items, per_page=per_page)
-        try:
-            items = paginator.page(number=page)
-        except EmptyPage:
-            items = []
+        self.cache_key, data = get_catalog('menu-items', cache_params, version)
+
+        if data is not None:
+            if cursor is not None:
+                data = cursor_response_data(request, data['results'], data['next'], data['previous'])
+            return with_validators(request, Response(data, status=status.HTTP_200_OK, headers={'X-Cache': 'HIT'}), self.etag)
 
-        serializer = MenuItemsSerializer(items, many=True)
+        return listing_for(self, params.filter(MenuItem.objects.select_related('category').all()), params, cursor)
 
-        return Response(serializer.data, status=status.HTTP_200_OK)   
+    def finish_list(self, request, listing, page):
+        if listing.cursor is not None:
+            set_catalog(self.cache_key, {'results': page.object_list, 'next': page.next_cursor, 'previous': page.previous_cursor})
+        else:
+            set_catalog(self.cache_key, page.object_list)
+
+        return with_validators(request, Response(listing.data(request, page), status=status.HTTP_200_OK, headers={'X-Cache': 'MISS'}), self.etag)
     
     
     def get_permissions(self):
@@ -99,8 +220,33 @@ class MenuItemsView(generics.ListCreateAPIView):
         return [IsManagerOrIsAdmin()]
     
 
+# OrderItem.quantity and Cart.quantity are SmallIntegerFields.
+MAX_QUANTITY = 32767
+
+
+def cart_items(items):
+    """
+    ``{menuitem_id: quantity}`` for a cart POST; the last entry for a menu
+    item wins. Raises KeyError for a missing menuitemId, ValueError or
+    TypeError for a bad value.
+    """
+    wanted = {}
+    for item in items:
+        if not hasattr(item, 'get'):
+            raise TypeError(item)
+        menuitem_id = item.get('menuitemId')
+        if menuitem_id in (None, ''):
+            raise KeyError('menuitemId')
+        menuitem_id, quantity = integer(menuitem_id), integer(item.get('quantity', 1))
+        if menuitem_id < 1 or not 1 <= quantity <= MAX_QUANTITY:
+            raise ValueError(item)
+        wanted[menuitem_id] = quantity
+    return wanted
+
+
 class CartMenuItemsView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'cart'
     serializer_class = CartItemsSerializer
 
     def get_queryset(self):
@@ -112,36 +258,52 @@ class CartMenuItemsView(generics.ListCreateAPIView):
 
     def post(self, request): 
 
-        menuitemId = self.request.data.get('menuitemId')
+        # A list of {menuitemId, quantity}, as the body itself or under
+        # "items", or a single one as the body.
+        data = self.request.data
+        if isinstance(data, list):
+            items = data
+        elif hasattr(data, 'get') and data.get('items') is not None:
+            items = data.get('items')
+        else:
+            items = [data]
 
-        if not menuitemId:
+        if not isinstance(items, list) or not items:
             return Response({"message": "Fields missing"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        quantity = int(self.request.data.get('quantity', 1))
-        
+
         try:
-            menuItem = get_object_or_404(MenuItem.objects.filter(id=menuitemId))
-        except ValueError:
+            wanted = cart_items(items)
+        except KeyError:
+            return Response({"message": "Fields missing"}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
             return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
 
-        
         user = self.request.user
 
-        existingCartItem = Cart.objects.filter(user=user,menuitem=menuItem).first()
-
-
-        if existingCartItem:
-           existingCartItem.quantity = quantity
-           existingCartItem.save()
-        else:
-            cartItem = Cart(
-            user=user,
-            menuitem=menuItem,
-            quantity=quantity,
-            unit_price=menuItem.price,
-            price=quantity*menuItem.price
-        )
-            cartItem.save()
+        # Two queries however many items: the menu items' prices, then one
+        # INSERT ... ON CONFLICT (menuitem, user) DO UPDATE for the lot.
+        with transaction.atomic():
+            menu_items = MenuItem.objects.only('id', 'price').in_bulk(list(wanted))
+
+            missing = [menuitem_id for menuitem_id in wanted if menuitem_id not in menu_items]
+            if missing:
+                return Response({"message": "Resource not found", "missing": missing}, status=status.HTTP_404_NOT_FOUND)
+
+            Cart.objects.bulk_create(
+                [
+                    Cart(
+                        user=user,
+                        menuitem_id=menuitem_id,
+                        quantity=quantity,
+                        unit_price=menu_items[menuitem_id].price,
+                        price=quantity * menu_items[menuitem_id].price,
+                    )
+                    for menuitem_id, quantity in wanted.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['menuitem', 'user'],
+                update_fields=['quantity', 'unit_price', 'price'],
+            )
         
         return Response({"message": "Added/updated successfully"}, status=status.HTTP_200_OK)
     
@@ -157,10 +319,19 @@ class CartMenuItemsView(generics.ListCreateAPIView):
 
 
 class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'menu-item'
     queryset = MenuItem.objects.all()
     serializer_class = SingleMenuItemSerializer
 
+    def get(self, request, *args, **kwargs):
+        etag = catalog_validators('menu-item', (kwargs['pk'],))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return with_validators(request, super().get(request, *args, **kwargs), etag)
+
     def get_permissions(self):
         if self.request.method == 'GET':
             return [IsAuthenticated()]
@@ -169,44 +340,45 @@ class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
      
     
 class ManagersView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'managers'
     serializer_class = GroupsSerializer
 
-    def IsManagerOrIsAdmin(self):
-        return self.request.user.groups.filter(name="Manager").exists() or self.request.user.is_staff
-        
     def get(self, request):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
    
-        group = Group.objects.filter(name="Manager").first()
+        group = group_id(MANAGER)
 
         if not group:
             return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        group_id = group.id
-        users = User.objects.filter(groups=group_id)
+        users = User.objects.filter(groups=group)
 
         return Response(users.values('id', 'username', 'email', 'groups'), status=status.HTTP_200_OK)
 
 
     def post(self, username):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
         
         username = self.request.data['username']
         if username:
             user = get_object_or_404(User, username=username)
-            managers = Group.objects.get(name="Manager")
-            managers.user_set.add(user)
+            group = group_id(MANAGER)
+
+            if not group:
+                return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            user.groups.add(group)
 
         return Response({"message": "user added to group"}, status=status.HTTP_200_OK)
 
     def delete(self, request, userId):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
         
 
@@ -215,58 +387,59 @@ class ManagersView(generics.ListCreateAPIView):
 
 
         user = get_object_or_404(User, id=userId)
+        group = group_id(MANAGER)
         
-        if not user.groups.filter(name="Manager").exists():
+        if not group or not user.groups.filter(id=group).exists():
             return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
 
         
-        managers = Group.objects.get(name="Manager")
-        managers.user_set.remove(user)
+        user.groups.remove(group)
         
         return Response({"message": "user removed from group"}, status=status.HTTP_200_OK)
     
 
 class DeliveryCrewsView(generics.ListCreateAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'delivery-crew'
     serializer_class = GroupsSerializer
 
-    def IsManagerOrIsAdmin(self):
-        return self.request.user.groups.filter(name="Manager").exists() or self.request.user.is_staff
-        
     def get(self, request):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        group = Group.objects.filter(name="DeliveryCrew").first()
+        group = group_id(DELIVERY_CREW)
 
         if not group:
             return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
         
-        group_id = group.id
-        users = User.objects.filter(groups=group_id)
+        users = User.objects.filter(groups=group)
 
         return Response(users.values('id', 'username', 'email', 'groups'), status=status.HTTP_200_OK)
 
 
     def post(self, username):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
         
         username = self.request.data['username']
 
         if username:
             user = get_object_or_404(User, username=username)
-            managers = Group.objects.get(name="DeliveryCrew")
-            managers.user_set.add(user)
+            group = group_id(DELIVERY_CREW)
+
+            if not group:
+                return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            user.groups.add(group)
 
         return Response({"message": "user added to group"}, status=status.HTTP_200_OK)
     
 
     def delete(self, request, userId):
 
-        if not self.IsManagerOrIsAdmin():
+        if not is_manager_or_admin(self.request):
             return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
         
 
@@ -275,142 +448,308 @@ class DeliveryCrewsView(generics.ListCreateAPIView):
 
 
         user = get_object_or_404(User, id=userId)
-        managers = Group.objects.get(name="DeliveryCrew")
-        managers.user_set.remove(user)
+        group = group_id(DELIVERY_CREW)
+
+        if not group:
+            return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        user.groups.remove(group)
         
         return Response({"message": "user removed from group"}, status=status.HTTP_200_OK)
 
     
 class OrderItemsView(generics.ListAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'orders'
+    replica_reads = True
     serializer_class = OrderItemsSerializer
-
-    def IsManagerOrIsAdmin(self):
-        return self.request.user.groups.filter(name="Manager").exists() or self.request.user.is_staff
+    row_serializer = rows.RowSerializer(OrdersSerializer)
 
     def get(self, request):
-        
+        listing = self.start_list(request)
+        if not isinstance(listing, Listing):
+            return listing
+        return Response(listing.data(request, listing.fetch()), status=status.HTTP_200_OK)
+
+    def start_list(self, request):
+        """The Listing a GET has to fetch, or its response when the parameters are invalid."""
         user = self.request.user
 
-        if self.IsManagerOrIsAdmin():
-            orders = Order.objects.all()
-        elif self.request.user.groups.filter(name="DeliveryCrew").exists():
-            orders = Order.objects.filter(delivery_crew=user.id)
+        if is_manager_or_admin(self.request):
+            orders = Order.objects.with_items()
+        elif is_delivery_crew(self.request):
+            orders = Order.objects.with_items().filter(delivery_crew=user.id)
         else:
-            orders = Order.objects.filter(user=user)
-   
-        if not orders:
-            return Response(Order.objects.none(), status=status.HTTP_200_OK)
-        
-        order_status = request.data.get('status')
-        ordering = request.data.get('ordering')
-        per_page = request.data.get('per_page', len(orders))
-        
-        try:
-            per_page = int(per_page)
-        except ValueError:
-            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        page = request.data.get('page', 1)
+            orders = Order.objects.with_items().filter(user=user)
         
         try:
-            page = int(page)
-        except ValueError:
-            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-
-        if order_status:
-            try:
-                orders = orders.filter(status=order_status)
-            except ValidationError:
-                return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
+            params = OrderFilter(request)
+        except InvalidFilter as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if ordering:
-            ordering_fields = ordering.split(",")
-            try:
-                orders = orders.order_by(*ordering_fields)
-            except FieldError:
-                return Response({"message": "Field error"}, status=status.HTTP_400_BAD_REQUEST)
-            
-
-        paginator = Paginator(orders, per_page=per_page)
-        try:
-            orders = paginator.page(number=page)
-        except EmptyPage:
-            orders = []
-       
-        serializer = OrdersSerializer(orders, many=True)
-        
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return listing_for(self, params.filter(orders), params, get_cursor(request))
     
 
     def post(self, request):
 
         user = self.request.user
-        cart = get_object_or_404(Cart.objects.filter(user=user))
 
-        total_order_price = 0
-        for item in cart:
-            total_order_price += Decimal(item.price)
+        # One transaction, four statements regardless of cart size: read the
+        # cart with its total, insert the order, bulk insert its items and
+        # empty the cart.
+        with transaction.atomic():
+            cart = list(
+                Cart.objects.filter(user=user)
+                .annotate(order_total=Window(Sum('price')))
+            )
 
-        # if not cart:
-        #     return Response({"message": "Resources not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        order = Order(
-            user=user,
-            total=total_order_price,
-            date=datetime.now()
-        )
-
-        order.save()
-
-        for item in cart:
-            orderItem = OrderItem(
-                order=order,
-                menuitem=item.menuitem,
-                quantity=item.quantity,
-                unit_price=item.unit_price,
-                price=item.price
+            if not cart:
+                return Response({"message": "Resources not found"}, status=status.HTTP_404_NOT_FOUND)
+            
+            order = Order.objects.create(
+                user=user,
+                total=cart[0].order_total,
+                date=datetime.now()
             )
-            orderItem.save()
 
-        cart.delete()
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    menuitem_id=item.menuitem_id,
+                    quantity=item.quantity,
+                    unit_price=item.unit_price,
+                    price=item.price
+                )
+                for item in cart
+            ])
+
+            deleted, _ = Cart.objects.filter(user=user, id__in=[item.id for item in cart]).delete()
+
+            if deleted != len(cart):
+                # A concurrent checkout or cart edit got there first.
+                transaction.set_rollback(True)
+                return Response({"message": "Cart changed during checkout"}, status=status.HTTP_409_CONFLICT)
 
         return Response({"message": "Order created"}, status=status.HTTP_200_OK)
     
 
+class OrderExportView(generics.GenericAPIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'orders-export'
+    replica_reads = True
+
+    def get(self, request, fmt):
+        if not is_manager_or_admin(request):
+            return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if fmt not in STREAMS:
+            return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            filters = OrderExportFilter(request).lookups()
+        except InvalidFilter as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(STREAMS[fmt](filters), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+        # Ask nginx not to buffer, so rows reach the client as they are read.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+def order_ids(value):
+    """A list of order ids from the request body; raises ValueError."""
+    if not isinstance(value, list) or not value:
+        raise ValueError(value)
+    ids = []
+    for id in value:
+        id = integer(id)
+        if id < 1:
+            raise ValueError(id)
+        ids.append(id)
+    return list(dict.fromkeys(ids))
+
+
+def balance(order_ids, crew):
+    """
+    Hand ``order_ids`` out one by one to whoever has the fewest open
+    orders. ``crew`` is ``[(user_id, open_orders)]``.
+    """
+    heap = [(open_orders, user_id) for user_id, open_orders in crew]
+    heapq.heapify(heap)
+    assigned = {}
+    for order_id in order_ids:
+        open_orders, user_id = heapq.heappop(heap)
+        assigned.setdefault(user_id, []).append(order_id)
+        heapq.heappush(heap, (open_orders + 1, user_id))
+    return assigned
+
+
+class OrderDispatchView(generics.GenericAPIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'orders-dispatch'
+
+    def post(self, request):
+        if not is_manager_or_admin(request):
+            return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        auto = request.data.get('auto') in (True, 'true', '1', 1)
+        ids = request.data.get('orders')
+        delivery_crew_id = request.data.get('delivery_crew')
+
+        try:
+            params = OrderDispatchFilter(request)
+            if ids is not None:
+                ids = order_ids(ids)
+            if delivery_crew_id is not None:
+                delivery_crew_id = integer(delivery_crew_id)
+        except InvalidFilter as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if ids is None and not params.given() and not auto:
+            return Response({"message": "Missing fields"}, status=status.HTTP_400_BAD_REQUEST)
+        if auto == (delivery_crew_id is not None):
+            return Response({"message": "Send either delivery_crew or auto"}, status=status.HTTP_400_BAD_REQUEST)
+
+        crew_members = User.objects.filter(groups=group_id(DELIVERY_CREW), is_active=True)
+
+        # Delivered orders stay with whoever delivered them; auto dispatch
+        # only hands out orders nobody has yet.
+        orders = params.filter(Order.objects.filter(status__in=[False]))
+        if ids is not None:
+            orders = orders.filter(id__in=ids)
+        if auto:
+            orders = orders.filter(delivery_crew__isnull=True)
+
+        with transaction.atomic():
+            if auto:
+                # One aggregate query: every crew member with their open orders.
+                crew = list(
+                    crew_members.annotate(open_orders=Count('delivery_crew', filter=Q(delivery_crew__status__in=[False])))
+                    .order_by('id').values_list('id', 'open_orders')
+                )
+                if not crew:
+                    return Response({"message": "No delivery crew"}, status=status.HTTP_400_BAD_REQUEST)
+            elif not crew_members.filter(id=delivery_crew_id).exists():
+                return Response({"message": "Delivery crew not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            found = list(
+                orders.select_for_update()
+                .order_by('date', 'id')
+                .values('id', 'user', 'status', 'delivery_crew')
+            )
+            unchanged = [] if auto else [row['id'] for row in found if row['delivery_crew'] == delivery_crew_id]
+            pending = [row for row in found if row['id'] not in unchanged]
+            pending_ids = [row['id'] for row in pending]
+            if auto:
+                assigned = balance(pending_ids, crew)
+            else:
+                assigned = {delivery_crew_id: pending_ids} if pending_ids else {}
+
+            now = timezone.now()
+            rows_by_id = {row['id']: row for row in pending}
+            for crew_id, crew_order_ids in assigned.items():
+                # One UPDATE per crew member.
+                Order.objects.filter(id__in=crew_order_ids).update(delivery_crew=crew_id, updated=now)
+                events.rows_changed([rows_by_id[id] for id in crew_order_ids], {'delivery_crew': crew_id}, now)
+
+        found_ids = {row['id'] for row in found}
+        missing = [id for id in ids if id not in found_ids] if ids is not None else []
+        skipped = []
+        if auto and missing:
+            # Open orders that already have a crew are left alone, not rejected.
+            taken = set(params.filter(Order.objects.filter(id__in=missing, status__in=[False], delivery_crew__isnull=False)).values_list('id', flat=True))
+            skipped = [id for id in missing if id in taken]
+        return Response({
+            "assigned": {str(crew_id): crew_order_ids for crew_id, crew_order_ids in assigned.items()},
+            "unchanged": unchanged,
+            "skipped": skipped,
+            "rejected": [id for id in missing if id not in skipped],
+        }, status=status.HTTP_200_OK)
+
+
+class OrderStatusView(generics.GenericAPIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'orders-status'
+
+    def post(self, request):
+        if is_manager_or_admin(request):
+            scoped = Order.objects.all()
+        elif is_delivery_crew(request):
+            # Scoped in the query itself: other crews' orders never match.
+            scoped = Order.objects.filter(delivery_crew=request.user)
+        else:
+            return Response({"message": "You are not authorized to perform this action"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        if request.data.get('orders') is None or request.data.get('status') is None:
+            return Response({"message": "Missing fields"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            ids = order_ids(request.data.get('orders'))
+            order_status = boolean(request.data.get('status'))
+        except (TypeError, ValueError):
+            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
+
+        scoped = scoped.filter(id__in=ids)
+
+        with transaction.atomic():
+            found = list(scoped.select_for_update().values('id', 'user', 'status', 'delivery_crew'))
+            pending = [row for row in found if row['status'] != order_status]
+            now = timezone.now()
+            if pending:
+                scoped.filter(status__in=[not order_status]).update(status=order_status, updated=now)
+                events.rows_changed(pending, {'status': order_status}, now)
+
+        found_ids = {row['id'] for row in found}
+        return Response({
+            "changed": [row['id'] for row in pending],
+            "unchanged": [row['id'] for row in found if row['status'] == order_status],
+            "rejected": [id for id in ids if id not in found_ids],
+        }, status=status.HTTP_200_OK)
+
+
 class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
-    throttle_classes = [UserRateThrottle]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'order'
     
-    def IsManagerOrIsAdmin(self):
-        return self.request.user.groups.filter(name="Manager").exists() or self.request.user.is_staff
-        
 
     def get(self, request, orderId):
 
-        user = request.user
+        order = get_object_or_404(self.owned(request, orderId))
 
-        order = get_object_or_404(Order.objects.filter(id=orderId, user=user))
+        etag = order_validators(order)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
 
+        prefetch_related_objects([order], items_prefetch())
         serialzer = OrdersSerializer(order)
 
-        return Response(serialzer.data, status=status.HTTP_200_OK)
+        return with_validators(request, Response(serialzer.data, status=status.HTTP_200_OK), etag)
+
+    def owned(self, request, orderId):
+        # The columns the validators and OrdersSerializer read.
+        return Order.objects.only('id', 'user', 'delivery_crew', 'status', 'total', 'date', 'updated').filter(id=orderId, user=request.user)
     
 
     def put(self, request, orderId):
 
-        if self.IsManagerOrIsAdmin():
+        if is_manager_or_admin(self.request):
 
             order = get_object_or_404(Order.objects.filter(id=orderId))
 
             order_status = request.data.get('status')
             delivery_crew_id = request.data.get('delivery_crew_id')
 
-            delivery_group_id = Group.objects.filter(name="DeliveryCrew").first()
-            delivery_crew = User.objects.filter(id=delivery_crew_id, groups=delivery_group_id).first()
+            delivery_crew = User.objects.filter(id=delivery_crew_id, groups=group_id(DELIVERY_CREW)).first()
 
             if not (order_status or delivery_crew):
                 return Response({"message": "Missing fields"}, status=status.HTTP_400_BAD_REQUEST)
 
+            previous = events.order_state(order)
+
             if order_status:
                 order.status = order_status
 
@@ -418,6 +757,7 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
                 order.delivery_crew = delivery_crew
             
             order.save()
+            events.order_changed(order, previous)
 
             return Response({"message": "Status updated"}, status=status.HTTP_200_OK)
         
@@ -427,29 +767,33 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     def patch(self, request, orderId):
         order = get_object_or_404(Order.objects.filter(id=orderId))
         
-        if self.IsManagerOrIsAdmin() or request.user.groups.filter(name="DeliveryCrew").exists():
+        if is_manager_or_admin(self.request) or is_delivery_crew(request):
             order_status = request.data.get('status')
 
-            if request.user.groups.filter(name="DeliveryCrew").exists():
+            if is_delivery_crew(request):
                 order = get_object_or_404(Order.objects.filter(id=orderId, delivery_crew=request.user))
                 
             
             if order_status:
 
+                previous = events.order_state(order)
                 order.status = order_status
                 order.save()
+                events.order_changed(order, previous)
 
                 return Response({"message": "Order updated."}, status=status.HTTP_200_OK)
         
         
-        if self.IsManagerOrIsAdmin():
+        if is_manager_or_admin(self.request):
             delivery_crew_id = request.data.get('delivery_crew')
             delivery_crew = User.objects.get(id=delivery_crew_id)
             
             if delivery_crew:
 
+                previous = events.order_state(order)
                 order.delivery_crew = delivery_crew
                 order.save()
+                events.order_changed(order, previous)
                 
                 return Response({"message": "Order updated."}, status=status.HTTP_200_OK)
         
@@ -459,7 +803,7 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     
     def delete(self, request, orderId):
 
-        if self.IsManagerOrIsAdmin():
+        if is_manager_or_admin(self.request):
             order = get_object_or_404(Order.objects.filter(id=orderId))
 
             order.delete()
@@ -471,6 +815,8 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     
 
 class OrderMenuitemView(generics.RetrieveUpdateDestroyAPIView):
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'order-item'
     
     def get(self, request, orderId, orderitemId):
         
@@ -488,56 +834,43 @@ class OrderMenuitemView(generics.RetrieveUpdateDestroyAPIView):
         
         quantity = request.data.get("quantity")
         
-        if not quantity:
+        if quantity in (None, ''):
             return Response({"message": "Fields missing"}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = get_object_or_404(Order.objects.filter(user=request.user, id=orderId))
-        
-        order_item = get_object_or_404(OrderItem.objects.filter(order=order, id=orderitemId))
-        
         try:
-            order_item.quantity = quantity
-            order_item.price = Decimal(quantity) * order_item.unit_price
-        except InvalidOperation:
-            return Response({"message": "Value error"}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            order_item.save()
-        
-        order_items = OrderItem.objects.filter(order=order)
-        
-        new_order_total = 0
-        for item in order_items:
-            new_order_total += item.price
-            
-        order.total = new_order_total
-        order.save()
-        
+            quantity = integer(quantity)
+        except ValueError:
+            quantity = None
+
+        if quantity is None or not 1 <= quantity <= MAX_QUANTITY:
+            return Response({"message": f"Quantity must be a whole number from 1 to {MAX_QUANTITY}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            order_item = get_object_or_404(OrderItem.objects.filter(order__user=request.user, order=orderId, id=orderitemId))
+
+            OrderItem.objects.filter(id=order_item.id).update(
+                quantity=quantity,
+                price=F('unit_price') * quantity
+            )
+            Order.objects.filter(id=orderId).recompute_totals()
         
         return Response({"message": "Updated successfully"}, status=status.HTTP_200_OK)
     
 
     def delete(self, request, orderId, orderitemId):
         
-        order = get_object_or_404(Order.objects.filter(user=request.user, id=orderId))
-        
-        if IsAdminUser():
-            order = get_object_or_404(Order.objects.filter(id=orderId))
-        
-        order_item = get_object_or_404(OrderItem.objects.filter(order=order, id=orderitemId))
-        
-        order_item.delete()
-        
-        order_items = OrderItem.objects.filter(order=order)
+        orders = Order.objects.all()
+        if not IsAdminUser().has_permission(request, self):
+            orders = orders.filter(user=request.user)
+
+        order = get_object_or_404(orders, id=orderId)
         
-        new_order_total = 0
-        for item in order_items:
-            new_order_total += item.price
-            
-        order.total = new_order_total
-        order.save()
+        with transaction.atomic():
+            deleted, _ = OrderItem.objects.filter(order=order, id=orderitemId).delete()
+
+            if not deleted:
+                return Response({"message": "Resource not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            Order.objects.filter(id=order.id).recompute_totals()
         
         return Response({"message": "Item removed from order successfully"}, status=status.HTTP_200_OK)
-        
-        
-        
-